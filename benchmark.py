@@ -0,0 +1,282 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from composite import (assemble_layout, build_pyramid, decode, decode_scaled, overlay_label, render_box, split_array, to_gray,
+                       view_geometry)
+from decisions import LabelRecorder
+from move_queue import MoveQueue
+
+# 合成图片的默认分辨率（拼接后整张图的宽x高）
+DEFAULT_SIZES = ['1536x512', '4608x1536', '8190x2730']
+# render_image 测试用的画布大小和缩放比例
+CANVAS_SIZE = (1168, 760)
+SCALES = [0.5, 1.0, 2.0, 5.0]
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'img_min_text')
+
+try:
+    LANCZOS = Image.Resampling.LANCZOS
+except AttributeError:
+    LANCZOS = Image.ANTIALIAS
+
+
+def make_triptych(width, height, seed=0):
+    # 生成 原图|掩码|修剪图 三联图：平滑渐变+噪声的原图，若干椭圆组成的掩码，修剪图为原图按掩码抠出
+    rng = np.random.default_rng(seed)
+    part_w = width // 3
+    yy, xx = np.mgrid[0:height, 0:part_w]
+    orig = np.empty((height, part_w, 3), dtype=np.uint8)
+    for c in range(3):
+        phase = rng.uniform(0, np.pi)
+        wave = np.sin(xx / part_w * np.pi * (c + 1) + phase) * np.cos(yy / height * np.pi * 2)
+        orig[..., c] = np.clip(127 + 100 * wave + rng.normal(0, 12, (height, part_w)), 0, 255)
+    mask = np.zeros((height, part_w), dtype=bool)
+    for _ in range(int(rng.integers(1, 5))):
+        cx, cy = rng.uniform(0, part_w), rng.uniform(0, height)
+        rx, ry = rng.uniform(0.05, 0.3) * part_w, rng.uniform(0.05, 0.3) * height
+        mask |= ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= 1
+    mask_rgb = np.repeat((mask * 255).astype(np.uint8)[..., None], 3, axis=2)
+    crop = orig * mask[..., None]
+    big = np.concatenate([orig, mask_rgb, crop], axis=1)
+    pad = width - big.shape[1]
+    if pad:
+        big = np.concatenate([big, np.zeros((height, pad, 3), dtype=np.uint8)], axis=1)
+    return Image.fromarray(big)
+
+
+def timeit(fn, repeat):
+    fn()  # 预热
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': statistics.median(times),
+        'min_ms': min(times),
+        'mean_ms': statistics.fmean(times),
+        'repeat': repeat,
+    }
+
+
+def bench_image(label, path, repeat, results):
+    # 依次测量 load_image / render_image 各阶段
+    big = decode(path)
+    h, w = big.shape[:2]
+    part_w = w // 3
+    orig = big[:, :part_w]
+    mask = to_gray(big[:, part_w:part_w * 2])
+    parts = split_array(big)
+    results[f'decode/{label}'] = timeit(lambda: decode(path), repeat)
+    # 按画布大小缩小解码
+    results[f'decode_view/{label}'] = timeit(lambda: decode_scaled(path, CANVAS_SIZE), repeat)
+    results[f'split/{label}'] = timeit(lambda: (big[:, :part_w], to_gray(big[:, part_w:part_w * 2]), big[:, part_w * 2:]), repeat)
+    results[f'overlay/{label}'] = timeit(lambda: overlay_label(orig, mask), repeat)
+    for layout_mode in ('grid', 'row'):
+        results[f'assemble_{layout_mode}/{label}'] = timeit(lambda: assemble_layout(parts, layout_mode), repeat)
+    levels = build_pyramid(assemble_layout(parts, 'row'))
+    results[f'pyramid/{label}'] = timeit(lambda: build_pyramid(levels[0]), repeat)
+    for scale in SCALES:
+        new_size, left, top, visible = view_geometry(levels.full_size, CANVAS_SIZE, scale, (0, 0))
+        # 旧做法：整张图缩放到目标尺寸
+        results[f'resize_full@{scale}/{label}'] = timeit(lambda: levels[0].resize(new_size, LANCZOS), repeat)
+        # 现做法：金字塔选层后只缩放可见区域
+        results[f'resize_view@{scale}/{label}'] = timeit(lambda: render_box(levels, new_size, visible, LANCZOS), repeat)
+
+
+def bench_file_ops(count, repeat, results):
+    # 分类移动/撤销的文件操作：界面线程入队耗时，以及后台落盘耗时
+    src = make_triptych(300, 100)
+    enqueue, commit, undo_commit, record = [], [], [], []
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix='piexl_bench_')
+        try:
+            os.makedirs(os.path.join(work_dir, '保留'))
+            names = [f'{i:05d}.png' for i in range(count)]
+            for name in names:
+                src.save(os.path.join(work_dir, name))
+            mover = MoveQueue(work_dir)
+            mover.recover()
+            mover.start()
+            start = time.perf_counter()
+            ids = [mover.move(name, '保留', i) for i, name in enumerate(names)]
+            enqueue.append((time.perf_counter() - start) * 1000 / count)
+            mover.flush()
+            commit.append((time.perf_counter() - start) * 1000 / count)
+            start = time.perf_counter()
+            for op_id, name in zip(ids, names):
+                mover.undo(op_id, name, '保留')
+            mover.flush()
+            undo_commit.append((time.perf_counter() - start) * 1000 / count)
+            mover.close()
+            recorder = LabelRecorder(os.path.join(work_dir, 'labels.jsonl'))
+            recorder.recover()
+            start = time.perf_counter()
+            for i, name in enumerate(names):
+                recorder.move(name, '保留', i)
+            record.append((time.perf_counter() - start) * 1000 / count)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    for key, times in (('move_enqueue', enqueue), ('move_commit', commit), ('undo_commit', undo_commit), ('label_record', record)):
+        results[f'{key}/per_file'] = {
+            'median_ms': statistics.median(times),
+            'min_ms': min(times),
+            'mean_ms': statistics.fmean(times),
+            'repeat': repeat,
+        }
+
+
+def run(sizes, repeat, use_samples, file_count):
+    results = {}
+    tmp = tempfile.mkdtemp(prefix='piexl_bench_')
+    try:
+        for size in sizes:
+            w, h = (int(v) for v in size.lower().split('x'))
+            path = os.path.join(tmp, f'synthetic_{size}.png')
+            make_triptych(w, h).save(path)
+            print(f"合成图片 {size} ...", file=sys.stderr)
+            bench_image(f'synthetic_{size}', path, repeat, results)
+        if use_samples:
+            samples = sorted(glob.glob(os.path.join(SAMPLE_DIR, '*.png')))[:3]
+            for path in samples:
+                print(f"示例图片 {os.path.basename(path)} ...", file=sys.stderr)
+                bench_image(os.path.splitext(os.path.basename(path))[0], path, repeat, results)
+        if file_count:
+            print("文件移动/撤销 ...", file=sys.stderr)
+            bench_file_ops(file_count, max(1, repeat // 2), results)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pillow': PIL.__version__,
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def run_startup(command, repeat, image_count, size):
+    # 冷启动：启动程序直接打开一个目录，显示第一张图片后退出；记录总耗时和程序自己报告的各阶段耗时
+    results = {}
+    samples = {}
+    tmp = tempfile.mkdtemp(prefix='piexl_bench_')
+    try:
+        w, h = (int(v) for v in size.lower().split('x'))
+        src = make_triptych(w, h)
+        for _ in range(repeat):
+            work_dir = tempfile.mkdtemp(dir=tmp)
+            for i in range(image_count):
+                src.save(os.path.join(work_dir, f'{i:05d}.jpg'), quality=90)
+            out = os.path.join(work_dir, 'startup.json')
+            start = time.perf_counter()
+            proc = subprocess.run(command + ['--workdir', work_dir, '--measure-startup', out],
+                                  capture_output=True, text=True, timeout=120)
+            wall = (time.perf_counter() - start) * 1000
+            if proc.returncode != 0 or not os.path.exists(out):
+                raise RuntimeError(proc.stderr.strip() or f"退出码 {proc.returncode}")
+            with open(out, encoding='utf-8') as f:
+                reported = json.load(f)
+            samples.setdefault('wall_ms', []).append(wall)
+            for key, value in reported.items():
+                samples.setdefault(key, []).append(value)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for key, times in samples.items():
+        results[f'startup/{key}'] = {
+            'median_ms': statistics.median(times),
+            'min_ms': min(times),
+            'mean_ms': statistics.fmean(times),
+            'repeat': len(times),
+        }
+    return results
+
+
+def compare(baseline, current, threshold):
+    # 按中位数比较，变慢超过 threshold 的项目记为回退
+    regressions = []
+    print(f"{'项目':<40}{'基线(ms)':>12}{'当前(ms)':>12}{'变化':>10}")
+    for key, cur in sorted(current['results'].items()):
+        base = baseline['results'].get(key)
+        if base is None:
+            print(f"{key:<40}{'-':>12}{cur['median_ms']:>12.2f}{'新增':>10}")
+            continue
+        change = cur['median_ms'] / base['median_ms'] - 1 if base['median_ms'] > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  <-- 回退'
+            regressions.append(key)
+        print(f"{key:<40}{base['median_ms']:>12.2f}{cur['median_ms']:>12.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="解码/拼图/缩放/分类吞吐量基准测试（无需界面）")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help="运行基准测试并保存结果")
+    run_parser.add_argument('--out', default='bench_results.json', help="结果文件")
+    run_parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help="合成图片尺寸，逗号分隔，如 1536x512,4608x1536")
+    run_parser.add_argument('--repeat', type=int, default=5, help="每项重复次数")
+    run_parser.add_argument('--no-samples', action='store_true', help="不测试 img_min_text 中的示例图片")
+    run_parser.add_argument('--files', type=int, default=200, help="文件移动测试的文件数，0 表示跳过")
+    run_parser.add_argument('--baseline', help="运行后与该基线结果比较")
+    run_parser.add_argument('--threshold', type=float, default=0.15, help="判定回退的变慢比例")
+    startup_parser = sub.add_parser('startup', help="测量冷启动到显示第一张图片的耗时（需要图形界面）")
+    startup_parser.add_argument('--exe', help="打包好的程序路径，默认用当前 Python 运行 data_q.py")
+    startup_parser.add_argument('--out', default='startup_results.json', help="结果文件")
+    startup_parser.add_argument('--repeat', type=int, default=5, help="启动次数")
+    startup_parser.add_argument('--images', type=int, default=20, help="测试目录中的图片数")
+    startup_parser.add_argument('--size', default='4608x1536', help="测试图片尺寸")
+    startup_parser.add_argument('--baseline', help="运行后与该基线结果比较")
+    startup_parser.add_argument('--threshold', type=float, default=0.15, help="判定回退的变慢比例")
+    cmp_parser = sub.add_parser('compare', help="比较两份结果")
+    cmp_parser.add_argument('baseline')
+    cmp_parser.add_argument('current')
+    cmp_parser.add_argument('--threshold', type=float, default=0.15, help="判定回退的变慢比例")
+    args = parser.parse_args(argv)
+    if args.command in ('run', 'startup'):
+        if args.command == 'run':
+            sizes = [s for s in args.sizes.split(',') if s]
+            current = run(sizes, args.repeat, not args.no_samples, args.files)
+        else:
+            command = [args.exe] if args.exe else [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_q.py')]
+            current = {'meta': {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'command': command},
+                       'results': run_startup(command, args.repeat, args.images, args.size)}
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.out}", file=sys.stderr)
+        if not args.baseline:
+            for key, r in sorted(current['results'].items()):
+                print(f"{key:<40}{r['median_ms']:>12.2f} ms")
+            return 0
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 项回退超过 {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
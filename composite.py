@@ -0,0 +1,193 @@
+import math
+
+import numpy as np
+from PIL import Image
+
+# 掩码阈值、叠加透明度、叠加颜色的默认值
+MASK_THRESHOLD = 30
+OVERLAY_ALPHA = 128
+OVERLAY_COLOR = (255, 0, 0)
+# 金字塔最小一层的短边长度
+PYRAMID_MIN_SIDE = 256
+
+
+def decode(path):
+    return np.asarray(Image.open(path).convert('RGB'))
+
+
+def layout_size(size, layout_mode):
+    # 由三联图尺寸推算拼好后的排版尺寸，与 assemble_layout 一致
+    w, h = size
+    part_w = w // 3
+    crop_w = w - part_w * 2
+    if layout_mode == "grid":
+        return part_w + max(part_w, crop_w), h * 2
+    return part_w * 3 + crop_w, h
+
+
+def view_target(size, view_size, layout_modes=("grid", "row")):
+    # 在 view_size 内完整显示时需要的最小三联图尺寸（各排版取较大者），不需要缩小时返回 None
+    ratio = 0.0
+    for layout_mode in layout_modes:
+        lw, lh = layout_size(size, layout_mode)
+        ratio = max(ratio, min(view_size[0] / lw, view_size[1] / lh))
+    if ratio >= 1:
+        return None
+    return max(1, math.ceil(size[0] * ratio)), max(1, math.ceil(size[1] * ratio))
+
+
+def decode_scaled(path, view_size):
+    # 按显示尺寸缩小解码：JPEG 用 draft 在 DCT 阶段直接按 1/2~1/8 解码，其余格式再用 reduce 整数倍缩小
+    # 返回 (数组, 原始尺寸)，放大超过这一分辨率时再按原图解码
+    img = Image.open(path)
+    full_size = img.size
+    need = view_target(full_size, view_size)
+    if need is not None:
+        if img.format == 'JPEG':
+            img.draft('RGB', need)
+        factor = min(img.width // need[0], img.height // need[1])
+        if factor > 1:
+            if img.mode not in ('RGB', 'RGBA', 'L'):
+                img = img.convert('RGB')
+            img = img.reduce(factor)
+    return np.asarray(img.convert('RGB')), full_size
+
+
+def to_gray(rgb):
+    # 与 PIL 的 convert('L') 逐像素一致：L = (R*19595 + G*38470 + B*7471 + 0x8000) >> 16
+    acc = rgb[..., 0].astype(np.uint32)
+    acc *= 19595
+    for c, weight in ((1, 38470), (2, 7471)):
+        tmp = rgb[..., c].astype(np.uint32)
+        tmp *= weight
+        acc += tmp
+    acc += 0x8000
+    acc >>= 16
+    return acc.astype(np.uint8)
+
+
+def blend_lut(alpha, color):
+    # 每个通道 256 项查找表，整数舍入方式与 PIL 的 Image.composite 相同
+    v = np.arange(256, dtype=np.uint32)
+    lut = np.empty((3, 256), dtype=np.uint8)
+    for c in range(3):
+        t = v * (255 - alpha) + color[c] * alpha + 128
+        lut[c] = ((t >> 8) + t) >> 8
+    return lut
+
+
+def split_array(big, threshold=MASK_THRESHOLD, alpha=OVERLAY_ALPHA, color=OVERLAY_COLOR):
+    # 原图/掩码/修剪图为零拷贝切片，只有灰度掩码和标注图需要新内存
+    h, w = big.shape[:2]
+    part_w = w // 3
+    orig = big[:, :part_w]
+    mask = to_gray(big[:, part_w:part_w * 2])
+    crop = big[:, part_w * 2:]
+    return orig, mask, overlay_label(orig, mask, threshold, alpha, color), crop
+
+
+def overlay_label(orig, mask, threshold=MASK_THRESHOLD, alpha=OVERLAY_ALPHA, color=OVERLAY_COLOR):
+    # 掩码灰度大于阈值的位置按透明度叠加颜色
+    lut = blend_lut(alpha, color)
+    hit = mask > threshold
+    label = orig.copy()
+    for c in range(3):
+        np.copyto(label[..., c], lut[c].take(orig[..., c]), where=hit)
+    return label
+
+
+class Parts(tuple):
+    # 原图/掩码/标注图/修剪图；full_size 为三联图的原始尺寸，缩小解码时大于分图实际拼出的尺寸
+    def __new__(cls, parts, full_size=None):
+        obj = super().__new__(cls, parts)
+        obj.full_size = tuple(full_size) if full_size else None
+        return obj
+
+
+def split_parts(path, threshold=MASK_THRESHOLD, alpha=OVERLAY_ALPHA, color=OVERLAY_COLOR):
+    return split_array(decode(path), threshold, alpha, color)
+
+
+def assemble_layout(parts, layout_mode):
+    # 预先分配一块输出缓冲区，四张分图直接写入对应位置
+    orig, mask, label, crop = parts
+    h, part_w = mask.shape
+    crop_w = crop.shape[1]
+    if layout_mode == "grid":
+        # 2x2宫格
+        col1_w = max(orig.shape[1], label.shape[1])
+        col2_w = max(part_w, crop_w)
+        out = np.zeros((h * 2, col1_w + col2_w, 3), dtype=np.uint8)
+        out[:h, :orig.shape[1]] = orig
+        out[:h, col1_w:col1_w + part_w] = mask[..., None]
+        out[h:, :label.shape[1]] = label
+        out[h:, col1_w:col1_w + crop_w] = crop
+    else:
+        # 1x4横排
+        out = np.empty((h, orig.shape[1] + part_w + label.shape[1] + crop_w, 3), dtype=np.uint8)
+        x = 0
+        for panel in (orig, mask[..., None], label, crop):
+            pw = panel.shape[1]
+            out[:, x:x + pw] = panel
+            x += pw
+    return Image.fromarray(out)
+
+
+def compose_image(path, layout_mode, threshold=MASK_THRESHOLD, alpha=OVERLAY_ALPHA, color=OVERLAY_COLOR):
+    return assemble_layout(split_parts(path, threshold, alpha, color), layout_mode)
+
+
+class Pyramid(list):
+    # 从大到小排列的各层图片；full_size 为原始分辨率下的尺寸，reduced 表示缺少原始分辨率那一层
+    def __init__(self, levels, full_size=None):
+        super().__init__(levels)
+        self.full_size = tuple(full_size or levels[0].size)
+        self.reduced = self.full_size != self[0].size
+
+
+def build_pyramid(img, min_side=PYRAMID_MIN_SIDE):
+    # 第 0 层为原图，之后每层用 reduce(2) 缩小一半，直到短边小于 min_side
+    levels = [img]
+    while min(levels[-1].size) // 2 >= min_side:
+        levels.append(levels[-1].reduce(2))
+    return Pyramid(levels)
+
+
+def pick_level(levels, size):
+    # 选不小于目标尺寸的最小一层，保证只做缩小采样
+    for level in reversed(levels):
+        if level.width >= size[0] and level.height >= size[1]:
+            return level
+    return levels[0]
+
+
+def compose_levels(parts, layout_mode):
+    levels = build_pyramid(assemble_layout(parts, layout_mode))
+    full_size = getattr(parts, 'full_size', None)
+    if full_size:
+        levels = Pyramid(levels, layout_size(full_size, layout_mode))
+    return levels
+
+
+def view_geometry(full_size, canvas_size, scale, offset):
+    # 计算缩放后图片尺寸、左上角在画布上的位置，以及可见区域（以缩放后图片左上角为原点）
+    img_w, img_h = full_size
+    w, h = canvas_size
+    max_w = int(w * scale)
+    max_h = int(h * scale)
+    ratio = min(max_w / img_w, max_h / img_h, 1.0 * scale)
+    new_size = (max(1, int(img_w * ratio)), max(1, int(img_h * ratio)))
+    # 中心点+偏移
+    left = w // 2 + offset[0] - new_size[0] // 2
+    top = h // 2 + offset[1] - new_size[1] // 2
+    visible = (max(0, -left), max(0, -top), min(new_size[0], w - left), min(new_size[1], h - top))
+    return new_size, left, top, visible
+
+
+def render_box(levels, new_size, box, resample):
+    # 从金字塔中选合适的一层，只重采样 box 对应的区域
+    level = pick_level(levels, new_size)
+    sx = level.width / new_size[0]
+    sy = level.height / new_size[1]
+    src_box = (box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy)
+    return level.resize((box[2] - box[0], box[3] - box[1]), resample, box=src_box)
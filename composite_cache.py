@@ -0,0 +1,116 @@
+from collections import OrderedDict
+
+# 每个条目保存四张分图（原图/掩码/标注/修剪图）以及已拼好的各排版金字塔
+PARTS = 'parts'
+
+
+def image_bytes(img):
+    if img is None:
+        return 0
+    if isinstance(img, (list, tuple)):
+        return sum(image_bytes(level) for level in img)
+    if hasattr(img, 'nbytes'):
+        return img.nbytes
+    return img.width * img.height * len(img.getbands())
+
+
+def parts_bytes(parts):
+    # 分图可能是同一块解码数组的切片，按底层缓冲区去重后再计数
+    seen = {}
+    for part in parts or ():
+        root = part
+        while getattr(root, 'base', None) is not None and hasattr(root.base, 'nbytes'):
+            root = root.base
+        seen[id(root)] = image_bytes(root)
+    return sum(seen.values())
+
+
+class CompositeCache:
+    # 按字节预算限制内存的 LRU 缓存；淘汰时优先保留当前图片附近（focus）的条目
+    def __init__(self, max_bytes, assemble):
+        self.max_bytes = max_bytes
+        self.assemble = assemble
+        self.entries = OrderedDict()
+        self.focus = set()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_failed(self, name):
+        entry = self.entries.get(name)
+        return entry is not None and entry[PARTS] is None and len(entry) == 1
+
+    def get(self, name, layout_mode):
+        # 命中排版图直接返回；只命中分图时现场重新拼接，不再解码原图
+        entry = self.entries.get(name)
+        levels = entry.get(layout_mode) if entry else None
+        if levels is None and entry is not None and entry[PARTS] is not None:
+            levels = self.assemble(entry[PARTS], layout_mode)
+            self._store(name, layout_mode, levels)
+            self._evict(name)
+        if levels is None:
+            # 没有分图的条目（如来自磁盘缓存）缺少该排版时按未命中处理，交给预取重新加载
+            if entry is not None and not self.is_failed(name):
+                self.discard(name)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return levels
+
+    def put(self, name, parts, layouts=None):
+        # layouts 为 {排版: 金字塔}；parts 和 layouts 都为空表示该图片解码失败，记录下来避免反复重试
+        self.discard(name)
+        self.entries[name] = {PARTS: parts}
+        self.total_bytes += parts_bytes(parts)
+        for layout_mode, levels in (layouts or {}).items():
+            self._store(name, layout_mode, levels)
+        self._evict(name)
+
+    def _store(self, name, layout_mode, levels):
+        entry = self.entries[name]
+        self.total_bytes += image_bytes(levels) - image_bytes(entry.get(layout_mode))
+        entry[layout_mode] = levels
+
+    def discard(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        self.total_bytes -= parts_bytes(entry.get(PARTS))
+        self.total_bytes -= sum(image_bytes(levels) for key, levels in entry.items() if key != PARTS)
+
+    def set_focus(self, names):
+        self.focus = set(names)
+
+    def _evict(self, keep):
+        # 先按 LRU 顺序淘汰窗口外的条目，仍超预算时再淘汰窗口内最久未用的；刚存入或刚读取的 keep 始终保留
+        while self.total_bytes > self.max_bytes:
+            victim = next((name for name in self.entries if name not in self.focus and name != keep), None)
+            if victim is None:
+                victim = next((name for name in self.entries if name != keep), None)
+            if victim is None:
+                break
+            self.discard(victim)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.focus = set()
+        self.total_bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
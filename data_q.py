@@ -1,20 +1,42 @@
+import time
+# 尽早记录启动时间，用于统计启动耗时
+STARTED = time.perf_counter()
+import argparse
+import json
+import multiprocessing
 import os
-import shutil
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import messagebox
-from tkinter import simpledialog
 from PIL import Image, ImageTk
+from composite import (MASK_THRESHOLD, OVERLAY_ALPHA, OVERLAY_COLOR, Parts, compose_levels, decode, decode_scaled, render_box,
+                       split_array, view_geometry)
+from composite_cache import CompositeCache
+from disk_cache import CACHE_DIR_NAME, DiskCache, cache_salt
+from move_queue import JOURNAL_NAME, MoveQueue
+from decisions import APPLY_MODES, LabelRecorder, apply_decisions, default_manifest_path
+from work_queue import WorkQueue, get_image_files, image_extensions, iter_image_files
+from metrics import LOG_DIR, Metrics, process_age
+from triage import DEFAULT_RULES, evaluate, score_dir
+from dedup import MAX_DISTANCE, build_index, cluster, distance
+from leases import CLAIMED, GONE, LEASED, LeaseManager, SharedMover
 import tkinter.ttk as ttk
 import tkinter.filedialog as filedialog
 
 # 设置分类文件夹
 categories = ['清洗', '保留', '阴影', '遮挡']
-image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
 
-# 获取当前目录所有图片
-def get_image_files(work_dir):
-    # 返回文件名列表
-    return [f for f in os.listdir(work_dir) if os.path.splitext(f)[1].lower() in image_extensions]
+# 后台解码原图失败时放在结果里的标记：界面保留已有的缩小版本，不当作加载失败
+FULL_RES_FAILED = object()
+
+# 判断矩形 outer 是否完全包含 inner，矩形格式为 (x0, y0, x1, y1)
+def box_contains(outer, inner):
+    if outer is None:
+        return False
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
 
 # 创建分类文件夹（如果不存在）
 def create_folders(work_dir):
@@ -68,28 +90,127 @@ class ImageSorter:
         self.root = root
         self.layout_mode = "grid"  # 必须最先初始化
         self.work_dir = os.getcwd()
-        self.image_files = []
+        self.image_files = WorkQueue()
         self.total_count = 0
+        # 目录扫描在后台线程进行，按块交回主线程
+        self.scan_results = queue.Queue()
+        self.scan_chunk = 512
+        self.scan_gen = 0
+        self.scanning = False
+        self.waiting_for_scan = False
+        self.listbox = None
+        self.picker_rows = 20
         self.index = 0
         self.history = []
+        self.mover = None
+        # 多人协作：多个实例处理同一共享目录时用租约文件分配图片，每人只领取接下来的 lease_ahead 张
+        self.shared = False
+        self.leases = None
+        self.lease_ahead = 16
+        self.lease_check_ms = 15000
+        self.lease_checked = 0.0
+        self.leased_elsewhere = set()
+        # 仅标注模式：分类键只写标签清单，之后再批量移动/复制/硬链接
+        self.label_only = False
+        self.manifest_path = None
+        self.apply_future = None
+        # 自动预分：按掩码统计量评分，队列按评分从高到低排序；命中阈值的图片可一键归入 triage_category
+        self.triage_rules = dict(DEFAULT_RULES)
+        self.triage_category = '清洗'
+        self.triage_sort = True
+        self.triage_future = None
+        self.triage_progress = [0, 0]
+        # 近似重复：扫描完成后在后台建立感知哈希索引，Ctrl+数字键把当前图片所在的整簇归入同一类
+        self.dedup_enabled = True
+        self.dedup_distance = MAX_DISTANCE
+        self.dedup_future = None
+        self.dedup_progress = [0, 0]
+        self.dedup_shown = None
+        # 建索引只用一半的 CPU，给预取留出余量
+        self.dedup_workers = max(1, (os.cpu_count() or 2) // 2)
+        self.clusters = {}
+        self.hashes = {}
         self.scale = 1.0
         self.min_scale = 0.1
         self.max_scale = 5.0
         self.img = None
+        self.pyramid = None
         self.tk_img = None
+        self.render_box = None
+        self.render_size = None
         self.offset_x = 0
         self.offset_y = 0
         self.drag_data = {'x': 0, 'y': 0, 'dragging': False}
-        self.label_cache = {}
+        # 缓存字节预算，超出后按 LRU 淘汰（优先保留预取窗口内的图片）
+        self.cache_max_bytes = 1024 * 1024 * 1024
+        self.label_cache = CompositeCache(self.cache_max_bytes, compose_levels)
+        # 掩码叠加参数：灰度大于阈值的位置按透明度叠加颜色
+        self.mask_threshold = MASK_THRESHOLD
+        self.overlay_alpha = OVERLAY_ALPHA
+        self.overlay_color = OVERLAY_COLOR
+        # 后台预取：当前图片前后各保留一个窗口的已拼好图片
+        self.prefetch_ahead = 10
+        self.prefetch_behind = 2
+        self.prefetch_poll_ms = 20
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 2) - 1)))
+        self.prefetch_results = queue.Queue()
+        self.pending = {}
+        self.prefetch_gen = 0
+        # 原图解码失败过的图片，不再重试
+        self.full_res_failed = set()
+        # 评分、建索引等耗时较长的后台任务不占用预取线程；两者各用一个线程，自动预分不必排在建索引后面
+        self.background = ThreadPoolExecutor(max_workers=1)
+        self.dedup_executor = ThreadPoolExecutor(max_workers=1)
+        self.background_stop = threading.Event()
+        # 磁盘缓存：默认放在工作目录下的 .piexl_cache，可改为其他目录
+        self.disk_cache_dir = None
+        # 单张缓存约 0.2~0.4MB，8GB 可容纳 2 万张以上
+        self.disk_cache_max_bytes = 8 * 1024 * 1024 * 1024
+        self.disk_cache = None
+        # 按画布大小缩小解码（JPEG draft + reduce），放大超过该分辨率时再解码原图
+        self.reduced_decode = True
+        self.waiting_for = None
         try:
             self.resample_method = Image.Resampling.LANCZOS
+            self.preview_resample = Image.Resampling.BILINEAR
         except AttributeError:
             self.resample_method = Image.ANTIALIAS
+            self.preview_resample = Image.BILINEAR
+        # 渲染调度：同一帧内的缩放/窗口变化/平移请求合并为一次重绘，停止操作后再做一次高质量重绘
+        self.frame_ms = 16
+        self.refine_delay_ms = 150
+        self.frame_job = None
+        self.frame_force = False
+        self.refine_job = None
+        self.render_resample = None
+        self.frame_stats = {'requests': 0, 'frames': 0, 'coalesced': 0, 'dropped': 0, 'refines': 0, 'max_ms': 0.0}
+        # 各阶段耗时统计和会话日志，F3 在画布左上角显示延迟
+        self.metrics = Metrics(LOG_DIR)
+        self.show_overlay = False
+        self.load_started = time.perf_counter()
+        self.shown_at = None
+        # 启动计时：窗口首次绘制和第一张图片显示后各记录一次；measure_startup 时显示第一张图片后自动退出
+        self.startup_pending = True
+        self.measure_startup = None
+        self.startup_times = {}
         self.root.title("图片分类工具 - 数据清洗")
         self.root.geometry("1200x945")
         self.root.configure(bg="#23272F")
         self.setup_style()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.show_workdir_selector()
+        self.root.after(self.prefetch_poll_ms, self._poll_prefetch)
+        self.root.after_idle(lambda: self.record_startup('window'))
+
+    def record_startup(self, stage):
+        # 从模块开始导入计时；能取到进程创建时间时另记一份（包含解释器启动，打包的 exe 还包含解压）
+        ms = (time.perf_counter() - STARTED) * 1000
+        age = process_age()
+        since_process = age * 1000 if age is not None else None
+        self.startup_times[f'{stage}_ms'] = round(ms, 1)
+        if since_process is not None:
+            self.startup_times[f'{stage}_since_process_ms'] = round(since_process, 1)
+        self.metrics.record(f'startup_{stage}', ms, since_process_ms=since_process, frozen=bool(getattr(sys, 'frozen', False)))
 
     def show_workdir_selector(self):
         self.workdir_frame = tk.Frame(self.root, bg="#23272F")
@@ -104,59 +225,171 @@ class ImageSorter:
                 path_var.set(d)
         btn = ttk.Button(self.workdir_frame, text="更改", style='Rounded.TButton', command=choose_dir)
         btn.pack(pady=8, ipadx=12, ipady=2)
+        label_only_var = tk.BooleanVar(value=self.label_only)
+        tk.Checkbutton(self.workdir_frame, text="仅记录标签（不移动文件，稍后批量应用）", variable=label_only_var,
+                       font=("SegoeUI", 12), bg="#23272F", fg="#F5F6FA", selectcolor="#353945",
+                       activebackground="#23272F", activeforeground="#F5F6FA").pack(pady=4)
+        shared_var = tk.BooleanVar(value=self.shared)
+        tk.Checkbutton(self.workdir_frame, text="多人协作（多人同时处理同一共享目录）", variable=shared_var,
+                       font=("SegoeUI", 12), bg="#23272F", fg="#F5F6FA", selectcolor="#353945",
+                       activebackground="#23272F", activeforeground="#F5F6FA").pack(pady=4)
         def ok():
-            self.work_dir = path_var.get()
             self.workdir_frame.destroy()
-            create_folders(self.work_dir)
-            self.image_files = get_image_files(self.work_dir)
-            self.total_count = len(self.image_files)
-            self.index = 0
-            self.history = []
-            self.scale = 1.0
-            self.img = None
-            self.tk_img = None
-            self.offset_x = 0
-            self.offset_y = 0
-            self.label_cache = {}
-            if self.image_files:
-                self.show_start_image_selector()
-            else:
-                self.init_main_ui()
-                self.load_image()
+            self.open_workdir(path_var.get(), label_only_var.get(), shared_var.get())
+            self.show_start_image_selector()
         ok_btn = ttk.Button(self.workdir_frame, text="确定", style='Rounded.TButton', command=ok)
         ok_btn.pack(pady=18, ipadx=16, ipady=4)
 
+    def open_workdir(self, work_dir, label_only=False, shared=False):
+        self.work_dir = work_dir
+        self.label_only = label_only
+        self.shared = shared
+        # 先回放上次会话的移动日志（或标签清单），再扫描图片
+        if self.mover is not None:
+            self.mover.close()
+        self.leases = None
+        self.leased_elsewhere = set()
+        suffix = ""
+        if shared:
+            try:
+                self.leases = LeaseManager(self.work_dir)
+                # 协作时每个实例按自己的编号各用一份日志/清单，互不覆盖
+                suffix = f".{self.leases.take_slot()}"
+            except OSError as e:
+                self.leases = None
+                messagebox.showwarning("多人协作", f"无法在工作目录中创建租约文件，按单人模式继续：{e}")
+        if self.label_only:
+            self.mover = LabelRecorder(self.manifest_path or default_manifest_path(self.work_dir, f"piexl_labels{suffix}.jsonl"))
+        else:
+            create_folders(self.work_dir)
+            self.mover = MoveQueue(self.work_dir, journal_name=JOURNAL_NAME.replace('.jsonl', f'{suffix}.jsonl'))
+        history = self.mover.recover()
+        self.mover.start()
+        if self.leases is not None:
+            self.leases.start()
+            self.mover = SharedMover(self.mover, self.leases)
+        # 后台流式扫描，扫到的图片陆续加入队列，不必等整个目录扫完
+        self.image_files = WorkQueue()
+        self.total_count = 0
+        self.start_scan({h[0] for h in history})
+        self.index = 0
+        self.history = history
+        self.scale = 1.0
+        self.img = None
+        self.pyramid = None
+        self.tk_img = None
+        self.offset_x = 0
+        self.offset_y = 0
+        self.label_cache.clear()
+        self.full_res_failed = set()
+        self.reset_prefetch()
+        self.disk_cache = self.open_disk_cache()
+        self.clusters = {}
+        self.hashes = {}
+
+    def skip_selectors(self, work_dir, label_only=False, shared=False):
+        # 命令行指定了工作目录：跳过选择界面，直接从第一张开始
+        self.workdir_frame.destroy()
+        self.open_workdir(work_dir, label_only, shared)
+        self.index = 0
+        self.init_main_ui()
+        self.load_image()
+
     def show_start_image_selector(self):
         self.selector_frame = tk.Frame(self.root, bg="#23272F")
         self.selector_frame.pack(expand=True, fill='both')
         tk.Label(self.selector_frame, text="请选择开始图片：", font=("SegoeUI", 14, "bold"), bg="#23272F", fg="#F5F6FA").pack(padx=10, pady=16)
+        # 按文件名查找并跳转
+        search_frame = tk.Frame(self.selector_frame, bg="#23272F")
+        search_frame.pack(padx=10, pady=4, fill='x')
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var, font=("SegoeUI", 12), bg="#353945", fg="#F5F6FA", bd=0, relief='flat')
+        search_entry.pack(side='left', fill='x', expand=True, ipady=4)
+        search_entry.bind('<Return>', lambda e: self.on_picker_search())
+        ttk.Button(search_frame, text="查找", style='Rounded.TButton', command=self.on_picker_search).pack(side='left', padx=(8, 0))
+        # 虚拟列表：Listbox 只放当前一屏的文件名，滚动条按总数换算
         list_frame = tk.Frame(self.selector_frame, bg="#23272F")
-        list_frame.pack(padx=10, pady=8, fill='both', expand=True)
-        self.start_var = tk.StringVar(value=self.image_files[0])
-        self.listbox = tk.Listbox(list_frame, listvariable=tk.StringVar(value=self.image_files),
-                                  selectmode='browse', height=12, width=40, bg="#23272F", fg="#F5F6FA", font=("SegoeUI", 12),
-                                  highlightthickness=0, selectbackground="#6750A4", selectforeground="#FFFFFF")
-        self.listbox.pack(side='left', fill='both', expand=True)
-        self.listbox.selection_set(0)
-        scrollbar = tk.Scrollbar(list_frame, orient='vertical', command=self.listbox.yview)
-        scrollbar.pack(side='right', fill='y')
-        self.listbox.config(yscrollcommand=scrollbar.set)
+        list_frame.pack(padx=10, pady=8, fill='x')
+        self.picker_top = 0
+        self.picker_selected = 0
+        self.listbox = tk.Listbox(list_frame, selectmode='browse', height=self.picker_rows, width=40, bg="#23272F", fg="#F5F6FA", font=("SegoeUI", 12),
+                                  highlightthickness=0, selectbackground="#6750A4", selectforeground="#FFFFFF", exportselection=False)
+        self.listbox.pack(side='left', fill='x', expand=True)
+        self.picker_scrollbar = tk.Scrollbar(list_frame, orient='vertical', command=self.on_picker_scroll)
+        self.picker_scrollbar.pack(side='right', fill='y')
         self.listbox.bind('<Double-Button-1>', lambda e: self.on_start_image_selected())
         self.listbox.bind('<MouseWheel>', self.on_listbox_mousewheel)
+        self.listbox.bind('<<ListboxSelect>>', self.on_picker_select)
+        self.listbox.bind('<Up>', lambda e: self.move_picker(-1))
+        self.listbox.bind('<Down>', lambda e: self.move_picker(1))
+        self.listbox.bind('<Prior>', lambda e: self.move_picker(-self.picker_rows))
+        self.listbox.bind('<Next>', lambda e: self.move_picker(self.picker_rows))
+        self.listbox.bind('<Return>', lambda e: self.on_start_image_selected())
+        self.picker_info = tk.Label(self.selector_frame, text="", font=("SegoeUI", 11), bg="#23272F", fg="#F5F6FA")
+        self.picker_info.pack(padx=10)
         ok_btn = ttk.Button(self.selector_frame, text="确定", style='Rounded.TButton', command=self.on_start_image_selected)
         ok_btn.pack(pady=18, ipadx=16, ipady=4)
+        self.listbox.focus_set()
+        self.refresh_picker()
 
-    def on_listbox_mousewheel(self, event):
-        self.listbox.yview_scroll(-1 * int(event.delta / 120), 'units')
+    def refresh_picker(self, message=None):
+        total = len(self.image_files)
+        self.picker_top = max(0, min(self.picker_top, total - self.picker_rows))
+        end = min(total, self.picker_top + self.picker_rows)
+        self.listbox.delete(0, 'end')
+        for i in range(self.picker_top, end):
+            self.listbox.insert('end', self.image_files[i])
+        if self.picker_top <= self.picker_selected < end:
+            self.listbox.selection_set(self.picker_selected - self.picker_top)
+        if total:
+            self.picker_scrollbar.set(self.picker_top / total, end / total)
+        else:
+            self.picker_scrollbar.set(0, 1)
+        text = f"第 {min(self.picker_selected + 1, total)} / {total} 张" + ("，正在扫描 ..." if self.scanning else "")
+        self.picker_info.config(text=f"{message}  {text}" if message else text)
 
-    def on_start_image_selected(self):
+    def on_picker_scroll(self, *args):
+        if args[0] == 'moveto':
+            self.picker_top = int(float(args[1]) * len(self.image_files))
+        elif args[0] == 'scroll':
+            self.picker_top += int(args[1]) * (self.picker_rows if args[2] == 'pages' else 1)
+        self.refresh_picker()
+
+    def on_picker_select(self, event=None):
         sel = self.listbox.curselection()
         if sel:
-            start_img = self.image_files[sel[0]]
-        else:
-            start_img = self.image_files[0]
-        self.index = self.image_files.index(start_img)
+            self.picker_selected = self.picker_top + sel[0]
+            self.refresh_picker()
+
+    def move_picker(self, delta):
+        total = len(self.image_files)
+        if not total:
+            return 'break'
+        self.picker_selected = max(0, min(total - 1, self.picker_selected + delta))
+        if self.picker_selected < self.picker_top:
+            self.picker_top = self.picker_selected
+        elif self.picker_selected >= self.picker_top + self.picker_rows:
+            self.picker_top = self.picker_selected - self.picker_rows + 1
+        self.refresh_picker()
+        return 'break'
+
+    def on_picker_search(self):
+        pos = self.image_files.find(self.search_var.get().strip(), self.picker_selected + 1)
+        if pos is None:
+            self.refresh_picker("未找到")
+            return
+        self.picker_selected = pos
+        self.picker_top = pos - self.picker_rows // 2
+        self.refresh_picker()
+
+    def on_listbox_mousewheel(self, event):
+        self.picker_top -= int(event.delta / 120) * 3
+        self.refresh_picker()
+
+    def on_start_image_selected(self):
+        self.index = self.picker_selected if self.picker_selected < len(self.image_files) else 0
         self.selector_frame.destroy()
+        self.listbox = None
         self.init_main_ui()
         self.load_image()
 
@@ -177,12 +410,8 @@ class ImageSorter:
         # 在canvas下方新建一行放切换按钮
         self.switch_frame = tk.Frame(self.root, bg="#23272F")
         self.switch_frame.pack(fill='x', padx=16, pady=(0, 2), anchor='e')
-        self.switch_icon_grid = self._create_grid_icon()
-        self.switch_icon_row = self._create_row_icon()
-        self.switch_btn = tk.Button(self.switch_frame, image=self.switch_icon_row if self.layout_mode=="grid" else self.switch_icon_grid,
-                                    command=self.toggle_layout, bd=0, bg="#23272F", activebackground="#353945", highlightthickness=2, relief='flat',
-                                    width=32, height=32)
-        self.switch_btn.pack(side='right', padx=2, pady=2)
+        # 切换按钮和右下角链接在第一张图片显示后再创建（见 finish_startup）
+        self.switch_btn = None
         self.button_frame = tk.Frame(self.root, bg="#23272F")
         self.button_frame.pack(pady=14)
         for cat in categories:
@@ -190,46 +419,61 @@ class ImageSorter:
             btn.pack(side='left', padx=8, ipadx=8, ipady=4)
         undo_btn = ttk.Button(self.button_frame, text="撤销", style='Rounded.TButton', width=10, command=self.undo)
         undo_btn.pack(side='left', padx=8, ipadx=8, ipady=4)
+        triage_btn = ttk.Button(self.button_frame, text="自动预分", style='Rounded.TButton', width=10, command=self.start_triage)
+        triage_btn.pack(side='left', padx=8, ipadx=8, ipady=4)
+        if self.label_only:
+            apply_btn = ttk.Button(self.button_frame, text="应用标签", style='Rounded.TButton', width=10, command=self.apply_labels)
+            apply_btn.pack(side='left', padx=8, ipadx=8, ipady=4)
         self.status_label = ttk.Label(self.root, text="", style='TLabel')
         self.status_label.pack(pady=8)
-        # 右下角GitHub
-        self.github_frame = tk.Frame(self.root, bg="#23272F")
-        self.github_frame.place(relx=1.0, rely=1.0, anchor='se', x=-12, y=-8)
-        try:
-            from urllib.request import urlopen
-            from io import BytesIO
-            from PIL import Image as PILImage, ImageTk as PILImageTk
-            icon_url = 'https://github.githubassets.com/images/modules/logos_page/GitHub-Mark-Light-32px.png'
-            icon_data = urlopen(icon_url).read()
-            icon_img = PILImage.open(BytesIO(icon_data))
-            self.github_icon = PILImageTk.PhotoImage(icon_img)
-            icon_label = tk.Label(self.github_frame, image=self.github_icon, bg="#23272F", cursor="hand2")
-            icon_label.pack(side='left')
-            icon_label.bind('<Button-1>', lambda e: self.open_github())
-        except Exception:
-            icon_label = tk.Label(self.github_frame, text="G", fg="#F5F6FA", bg="#23272F", font=("SegoeUI", 14, "bold"), cursor="hand2")
-            icon_label.pack(side='left')
-            icon_label.bind('<Button-1>', lambda e: self.open_github())
-        link_label = tk.Label(self.github_frame, text="Github jdhnsu", fg="#F5F6FA", bg="#23272F", font=("SegoeUI", 10, "underline"), cursor="hand2")
-        link_label.pack(side='left', padx=(4,0))
-        link_label.bind('<Button-1>', lambda e: self.open_github())
 
         # 全局快捷键绑定
         self.root.bind_all("1", lambda e: self.move_image("清洗"))
         self.root.bind_all("2", lambda e: self.move_image("保留"))
         self.root.bind_all("3", lambda e: self.move_image("阴影"))
         self.root.bind_all("4", lambda e: self.move_image("遮挡"))
+        for key, cat in zip("1234", categories):
+            self.root.bind_all(f"<Control-Key-{key}>", lambda e, c=cat: self.move_cluster(c))
         self.root.bind_all("z", lambda e: self.undo())
         self.root.bind_all("<Control-plus>", self.ctrl_plus)
         self.root.bind_all("<Control-minus>", self.ctrl_minus)
         self.root.bind_all("<Control-equal>", self.ctrl_plus)
-        self.root.bind_all("<Configure>", self.on_resize)
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.root.bind_all("<F2>", lambda e: self.show_render_stats())
+        self.root.bind_all("<F3>", lambda e: self.toggle_overlay())
         # 方向键全局绑定，兼容所有焦点情况
         self.root.bind_all('<Left>', lambda e: self.arrow_pan(-40, 0))
         self.root.bind_all('<Right>', lambda e: self.arrow_pan(40, 0))
         self.root.bind_all('<Up>', lambda e: self.arrow_pan(0, -40))
         self.root.bind_all('<Down>', lambda e: self.arrow_pan(0, 40))
 
+    def finish_startup(self):
+        # 第一张图片画出来之后再做的启动工作
+        self.record_startup('first_image')
+        self.switch_icon_grid = self._create_grid_icon()
+        self.switch_icon_row = self._create_row_icon()
+        self.switch_btn = tk.Button(self.switch_frame, image=self.switch_icon_row if self.layout_mode=="grid" else self.switch_icon_grid,
+                                    command=self.toggle_layout, bd=0, bg="#23272F", activebackground="#353945", highlightthickness=2, relief='flat',
+                                    width=32, height=32)
+        self.switch_btn.pack(side='right', padx=2, pady=2)
+        # 右下角GitHub（不联网下载图标，离线环境下也不会卡住）
+        self.github_frame = tk.Frame(self.root, bg="#23272F")
+        self.github_frame.place(relx=1.0, rely=1.0, anchor='se', x=-12, y=-8)
+        icon_label = tk.Label(self.github_frame, text="G", fg="#F5F6FA", bg="#23272F", font=("SegoeUI", 14, "bold"), cursor="hand2")
+        icon_label.pack(side='left')
+        icon_label.bind('<Button-1>', lambda e: self.open_github())
+        link_label = tk.Label(self.github_frame, text="Github jdhnsu", fg="#F5F6FA", bg="#23272F", font=("SegoeUI", 10, "underline"), cursor="hand2")
+        link_label.pack(side='left', padx=(4,0))
+        link_label.bind('<Button-1>', lambda e: self.open_github())
+        if self.measure_startup:
+            # 打包成无控制台的 exe 时没有 stdout，可指定输出文件
+            if self.measure_startup == '-':
+                print(json.dumps(self.startup_times), flush=True)
+            else:
+                with open(self.measure_startup, 'w', encoding='utf-8') as f:
+                    json.dump(self.startup_times, f)
+            self.on_close()
+
     def mousewheel_zoom(self, event):
         if event.delta > 0:
             self.ctrl_plus()
@@ -266,114 +510,596 @@ class ImageSorter:
     def toggle_layout(self):
         self.layout_mode = "row" if self.layout_mode=="grid" else "grid"
         # 切换按钮图标
-        self.switch_btn.config(image=self.switch_icon_row if self.layout_mode=="grid" else self.switch_icon_grid)
+        if self.switch_btn is not None:
+            self.switch_btn.config(image=self.switch_icon_row if self.layout_mode=="grid" else self.switch_icon_grid)
         self.load_image()
 
     def load_image(self):
+        if self.index >= len(self.image_files) and self.scanning:
+            # 还没扫描到这里，等下一批文件名
+            self.waiting_for_scan = True
+            self.img = None
+            self.canvas.delete('all')
+            self.status_label.config(text="正在扫描图片 ...")
+            return
+        self.waiting_for_scan = False
+        if self.leases is not None:
+            self.claim_current()
         if self.index >= len(self.image_files):
             self.canvas.delete('all')
+            self.img = None
+            if self.leased_elsewhere:
+                self.status_label.config(text=f"自己的部分已分完，其余 {len(self.leased_elsewhere)} 张正在由他人处理，对方租约过期后会自动回到队列")
+                return
             self.status_label.config(text="🎉 所有图片已分类完成！")
             messagebox.showinfo("完成", "所有图片已完成分类。")
             return
         img_name = self.image_files[self.index]
-        img_path = os.path.join(self.work_dir, img_name)
-        # 优先从缓存读取
-        if img_name in self.label_cache and self.label_cache[img_name].get(self.layout_mode):
-            new_img = self.label_cache[img_name][self.layout_mode]
-        else:
-            seg_size = 10
-            seg_start = (self.index // seg_size) * seg_size
-            seg_end = min(seg_start + seg_size, len(self.image_files))
-            for i in range(seg_start, seg_end):
-                name = self.image_files[i]
-                path = os.path.join(self.work_dir, name)
-                if name in self.label_cache and self.label_cache[name].get(self.layout_mode):
-                    continue
-                try:
-                    big_img = Image.open(path).convert('RGB')
-                    w, h = big_img.size
-                    part_w = w // 3
-                    orig_img = big_img.crop((0, 0, part_w, h))
-                    mask_img = big_img.crop((part_w, 0, part_w * 2, h)).convert('L')
-                    crop_img = big_img.crop((part_w * 2, 0, w, h))
-                    label_img = orig_img.copy()
-                    red = Image.new('RGB', orig_img.size, (255,0,0))
-                    label_img = Image.composite(red, label_img, mask_img.point(lambda x: 128 if x > 30 else 0))
-                    if name not in self.label_cache:
-                        self.label_cache[name] = {}
-                    if self.layout_mode == "grid":
-                        # 2x2宫格
-                        w1, h1 = orig_img.size
-                        w2, h2 = mask_img.size
-                        w3, h3 = label_img.size
-                        w4, h4 = crop_img.size
-                        row1_h = max(h1, h2)
-                        row2_h = max(h3, h4)
-                        col1_w = max(w1, w3)
-                        col2_w = max(w2, w4)
-                        total_w = col1_w + col2_w
-                        total_h = row1_h + row2_h
-                        grid_img = Image.new('RGB', (total_w, total_h), (0,0,0))
-                        grid_img.paste(orig_img, (0, 0))
-                        grid_img.paste(mask_img.convert('RGB'), (col1_w, 0))
-                        grid_img.paste(label_img, (0, row1_h))
-                        grid_img.paste(crop_img, (col1_w, row1_h))
-                        self.label_cache[name]["grid"] = grid_img
-                    else:
-                        # 1x4横排
-                        imgs = [orig_img, mask_img.convert('RGB'), label_img, crop_img]
-                        total_w = sum(im.width for im in imgs)
-                        max_h = max(im.height for im in imgs)
-                        row_img = Image.new('RGB', (total_w, max_h), (0,0,0))
-                        x = 0
-                        for im in imgs:
-                            row_img.paste(im, (x, 0))
-                            x += im.width
-                        self.label_cache[name]["row"] = row_img
-                except Exception as e:
-                    if name not in self.label_cache:
-                        self.label_cache[name] = {}
-                    self.label_cache[name][self.layout_mode] = None
-            new_img = self.label_cache.get(img_name, {}).get(self.layout_mode)
-            if new_img is None:
-                self.canvas.delete('all')
-                self.status_label.config(text=f"图片加载失败: {img_name}")
-                return
-        self.img = new_img
+        if self.waiting_for != img_name:
+            # 从这里开始计算本张图片的显示延迟（等待预取时不重新计时）
+            self.load_started = time.perf_counter()
+        # 优先从缓存读取，未命中则交给后台预取，结果回到主线程后再显示
+        levels = self.label_cache.get(img_name, self.layout_mode)
+        if levels is None and not self.label_cache.is_failed(img_name):
+            self.waiting_for = img_name
+            # 先只加载当前这张，显示出来后再预取前后的窗口
+            self.schedule_prefetch(current_only=True)
+            self.img = None
+            self.canvas.delete('all')
+            self.status_label.config(text=f"正在加载: {img_name} ...")
+            return
+        self.waiting_for = None
+        self.schedule_prefetch()
+        if levels is None:
+            self.canvas.delete('all')
+            self.status_label.config(text=f"图片加载失败: {img_name}")
+            return
+        self.pyramid = levels
+        self.img = levels[0]
         self.offset_x = 0
         self.offset_y = 0
         self.render_image()
+        self.shown_at = time.perf_counter()
+        self.metrics.record('image', (self.shown_at - self.load_started) * 1000, image=img_name, layout=self.layout_mode)
+        self.update_status(img_name)
+        self.draw_overlay()
+
+    def update_status(self, img_name):
         done = self.total_count - len(self.image_files) + self.index + 1
-        self.status_label.config(text=f"当前图片：{img_name} (已分 {done}/{self.total_count}) - 快捷键：1清洗 2保留 3阴影 4遮挡  滚轮/Ctrl +/Ctrl -(缩放)")
+        text = f"当前图片：{img_name} (已分 {done}/{self.total_count}) - 快捷键：1清洗 2保留 3阴影 4遮挡  滚轮/Ctrl +/Ctrl -(缩放)"
+        similar = len(self.cluster_of(img_name))
+        if similar > 1:
+            text += f"\n近似重复 {similar} 张，Ctrl+数字键整簇分类"
+        if self.dedup_future is not None and self.dedup_progress[1]:
+            self.dedup_shown = list(self.dedup_progress)
+            text += f"\n正在建立近似重复索引 {self.dedup_progress[0]}/{self.dedup_progress[1]} ..."
+        if self.leases is not None:
+            progress = self.leases.progress()
+            text += f"\n多人协作：{progress['annotators']} 人在线，全部已分 {progress['done']} 张"
+        self.status_label.config(text=text)
+
+    def schedule_prefetch(self, current_only=False):
+        # 以当前图片为中心，预取前 prefetch_ahead 张、后 prefetch_behind 张
+        start = max(0, self.index - self.prefetch_behind)
+        end = min(len(self.image_files), self.index + (1 if current_only else self.prefetch_ahead + 1))
+        if current_only:
+            start = self.index
+        order = list(range(self.index, end)) + list(range(self.index - 1, start - 1, -1))
+        window = [self.image_files[i] for i in order]
+        self.label_cache.set_focus(window)
+        view_size = self.decode_view_size() if self.reduced_decode else None
+        for name in window:
+            if name in self.label_cache or name in self.pending:
+                continue
+            path = os.path.join(self.work_dir, name)
+            self.pending[name] = self.executor.submit(self._prefetch_task, self.prefetch_gen, name, path, self.layout_mode, view_size)
+        # 窗口外尚未开始的任务直接取消，避免占用工作线程
+        wanted = set(window)
+        for name in list(self.pending):
+            if name not in wanted and self.pending[name].cancel():
+                del self.pending[name]
 
-    def render_image(self, force_new_img=True):
+    def decode_view_size(self):
+        # 解码目标尺寸：当前画布（未布局时用屏幕大小），已放大时按当前缩放比例放大
+        w = self.canvas.winfo_width()
+        h = self.canvas.winfo_height()
+        if w < 100 or h < 100:
+            w = self.root.winfo_screenwidth()
+            h = self.root.winfo_screenheight()
+        scale = max(1.0, self.scale)
+        return int(w * scale), int(h * scale)
+
+    def _prefetch_task(self, gen, name, path, layout_mode, view_size=None, full_res=False):
+        # 工作线程：只做读缓存、解码和拼图，不碰任何 Tk 对象
+        if self.mover is not None:
+            # 刚撤销的图片可能还在移回工作目录的路上
+            self.mover.wait(name)
+        disk_cache = self.disk_cache
+        if disk_cache is not None and not full_res:
+            with self.metrics.stage('disk_read', image=name):
+                cached = disk_cache.get(path, (layout_mode,))
+            if cached is not None:
+                self.prefetch_results.put((gen, name) + cached)
+                return
+        try:
+            with self.metrics.stage('decode', image=name, reduced=view_size is not None and not full_res):
+                if view_size is None or full_res:
+                    big, full_size = decode(path), None
+                else:
+                    big, full_size = decode_scaled(path, view_size)
+            with self.metrics.stage('split', image=name):
+                parts = Parts(split_array(big, self.mask_threshold, self.overlay_alpha, self.overlay_color), full_size)
+            with self.metrics.stage('assemble', image=name, layout=layout_mode):
+                layouts = {layout_mode: compose_levels(parts, layout_mode)}
+        except Exception as e:
+            self.metrics.event('load_failed', image=name, error=str(e), full_res=full_res)
+            self.prefetch_results.put((gen, name, FULL_RES_FAILED if full_res else None, None))
+            return
+        self.prefetch_results.put((gen, name, parts, layouts))
+        # 先把结果交给界面，再写磁盘缓存
+        if disk_cache is not None and not full_res:
+            try:
+                with self.metrics.stage('disk_write', image=name):
+                    disk_cache.put(path, parts)
+            except Exception:
+                pass
+
+    def request_full_res(self):
+        # 缩放超过缩小解码或磁盘缓存里最大一层时，后台解码原图替换当前金字塔
+        img_name = self.image_files[self.index]
+        if img_name in self.pending or img_name in self.full_res_failed:
+            return
+        path = os.path.join(self.work_dir, img_name)
+        self.pending[img_name] = self.executor.submit(self._prefetch_task, self.prefetch_gen, img_name, path, self.layout_mode, full_res=True)
+
+    def open_disk_cache(self):
+        cache_dir = self.disk_cache_dir or os.path.join(self.work_dir, CACHE_DIR_NAME)
+        salt = cache_salt(self.mask_threshold, self.overlay_alpha, self.overlay_color)
+        return DiskCache(cache_dir, self.disk_cache_max_bytes, salt=salt)
+
+    def _poll_prefetch(self):
+        # 主线程：通过 root.after 定时取回后台结果
+        while True:
+            try:
+                gen, name, parts, layouts = self.prefetch_results.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self.prefetch_gen:
+                continue
+            self.pending.pop(name, None)
+            if parts is FULL_RES_FAILED:
+                # 不再重试，继续用缩小版本
+                self.full_res_failed.add(name)
+                continue
+            self.label_cache.put(name, parts, layouts)
+            if self.waiting_for == name:
+                self.load_image()
+            elif self.pyramid is not None and self.pyramid.reduced and self.index < len(self.image_files) and self.image_files[self.index] == name:
+                # 原图分辨率到达后原地替换，保持当前缩放和平移
+                levels = self.label_cache.get(name, self.layout_mode)
+                if levels is not None:
+                    self.pyramid = levels
+                    self.img = levels[0]
+                    self.render_image()
+        self._poll_scan()
+        if self.mover is not None:
+            self.check_move_failures()
+        if self.apply_future is not None and self.apply_future.done():
+            self.finish_apply_labels()
+        if self.leases is not None and time.monotonic() - self.lease_checked > self.lease_check_ms / 1000:
+            self.reclaim_leases()
+        if self.dedup_future is not None:
+            if self.dedup_future.done():
+                self.finish_dedup()
+            elif (self.dedup_progress != self.dedup_shown and self.img is not None and self.triage_future is None
+                  and self.index < len(self.image_files)):
+                self.update_status(self.image_files[self.index])
+        if self.triage_future is not None:
+            if self.triage_future.done():
+                self.finish_triage()
+            elif self.triage_progress[1]:
+                self.status_label.config(text=f"正在评分 {self.triage_progress[0]}/{self.triage_progress[1]} ...")
+        self.root.after(self.prefetch_poll_ms, self._poll_prefetch)
+
+    def start_scan(self, exclude):
+        self.scan_gen += 1
+        self.scanning = True
+        threading.Thread(target=self._scan_task, args=(self.scan_gen, self.work_dir, exclude), daemon=True).start()
+
+    def _scan_task(self, gen, work_dir, exclude):
+        chunk = []
+        try:
+            for name in iter_image_files(work_dir):
+                if name in exclude:
+                    continue
+                chunk.append(name)
+                if len(chunk) >= self.scan_chunk:
+                    self.scan_results.put((gen, chunk))
+                    chunk = []
+        finally:
+            self.scan_results.put((gen, chunk))
+            self.scan_results.put((gen, None))
+
+    def _poll_scan(self):
+        changed = False
+        while True:
+            try:
+                gen, chunk = self.scan_results.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self.scan_gen:
+                continue
+            changed = True
+            if chunk is None:
+                self.scanning = False
+                self.start_dedup()
+                continue
+            self.image_files.extend(chunk)
+            self.total_count += len(chunk)
+        if not changed:
+            return
+        if self.listbox is not None:
+            if not self.scanning and not len(self.image_files):
+                # 目录里没有图片，直接进入主界面显示完成
+                self.on_start_image_selected()
+            else:
+                self.refresh_picker()
+        elif self.waiting_for_scan:
+            self.load_image()
+        elif self.waiting_for is None and self.img is not None:
+            self.schedule_prefetch()
+
+    def check_move_failures(self):
+        failures = self.mover.pop_failures()
+        if not failures:
+            return
+        failed_ids = {op['id'] for op, _ in failures}
+        history = []
+        for h in self.history:
+            if isinstance(h, list):
+                # 整簇分类的一步撤销只去掉失败的那几张
+                h = [m for m in h if m[3] not in failed_ids]
+                if h:
+                    history.append(h)
+            elif h[3] not in failed_ids:
+                history.append(h)
+        self.history = history
+        # 移动失败的文件还在工作目录里，放回队列，保持当前图片不变
+        current = self.image_files[self.index] if self.index < len(self.image_files) else None
+        for op, _ in failures:
+            if op['op'] == 'move':
+                self.image_files.restore(op['name'])
+                if self.leases is not None:
+                    # 分类时已写了完成标记，去掉后重新由自己持有
+                    self.leases.reopen(op['name'])
+        if current is not None:
+            self.index = self.image_files.index(current)
+        elif len(self.image_files):
+            # 原本已经分完，回到放回的图片
+            self.index = min(self.index, len(self.image_files) - 1)
+            self.load_image()
+        messagebox.showwarning("移动失败", "\n".join(f"{op['name']}: {err}" for op, err in failures))
+
+    def apply_labels(self):
+        if self.apply_future is not None:
+            return
+        from tkinter import simpledialog
+        mode = simpledialog.askstring("应用标签", "应用方式：move（移动） / copy（复制） / link（硬链接）", initialvalue="move")
+        if mode is None:
+            return
+        mode = mode.strip().lower()
+        if mode not in APPLY_MODES:
+            messagebox.showwarning("提示", f"未知的应用方式: {mode}")
+            return
+        self.apply_mode = mode
+        self.apply_future = self.executor.submit(apply_decisions, self.work_dir, self.mover.manifest_path, mode)
+        self.status_label.config(text="正在应用标签 ...")
+
+    def finish_apply_labels(self):
+        future, self.apply_future = self.apply_future, None
+        try:
+            stats = future.result()
+        except Exception as e:
+            messagebox.showwarning("应用失败", str(e))
+            return
+        if self.apply_mode == 'move' and not stats['failures']:
+            # 文件已经移走，归档清单并清空历史，之后的撤销不再作用于已应用的标签
+            manifest = self.mover.manifest_path
+            os.replace(manifest, f"{os.path.splitext(manifest)[0]}.applied-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+            self.mover = LabelRecorder(manifest)
+            self.mover.recover()
+            if self.leases is not None:
+                self.mover = SharedMover(self.mover, self.leases)
+            self.history = []
+        text = (f"共 {stats['total']} 张，完成 {stats['done']}，跳过 {stats['skipped']}，失败 {len(stats['failures'])}\n"
+                f"耗时 {stats['seconds']:.2f}s（{stats['per_second']:.1f} 张/秒）")
+        if stats['failures']:
+            text += "\n" + "\n".join(f"{name}: {err}" for name, err in stats['failures'][:20])
+        messagebox.showinfo("应用标签", text)
+        self.load_image()
+
+    def start_triage(self):
+        if self.triage_future is not None:
+            return
+        if self.scanning:
+            messagebox.showinfo("提示", "正在扫描图片，请扫描完成后再自动预分。")
+            return
+        self.triage_progress = [0, 0]
+
+        def progress(i, total):
+            self.triage_progress = [i, total]
+
+        self.triage_future = self.background.submit(score_dir, self.work_dir, list(self.image_files),
+                                                    threshold=self.mask_threshold, progress=progress, stop=self.background_stop)
+        self.status_label.config(text="正在评分 ...")
+
+    def finish_triage(self):
+        future, self.triage_future = self.triage_future, None
+        try:
+            items, failures = future.result()
+        except Exception as e:
+            messagebox.showwarning("自动预分失败", str(e))
+            return
+        scores = {}
+        flagged = []
+        for name in self.image_files:
+            stats = items.get(name)
+            if stats is None:
+                continue
+            scores[name], reason = evaluate(stats, self.triage_rules)
+            if reason:
+                flagged.append((name, reason))
+        if self.triage_sort:
+            # 稳定排序，同分的图片保持原来的顺序；从最可疑的一张开始
+            self.image_files = WorkQueue(sorted(self.image_files, key=lambda name: -scores.get(name, 0.0)))
+            self.index = 0
+            self.reset_prefetch()
+        text = f"已评分 {len(scores)} 张，命中阈值 {len(flagged)} 张，失败 {len(failures)} 张。"
+        if flagged and self.triage_category:
+            counts = {}
+            for _, reason in flagged:
+                for r in reason.split(','):
+                    counts[r] = counts.get(r, 0) + 1
+            detail = "，".join(f"{r} {n}" for r, n in counts.items())
+            if messagebox.askyesno("自动预分", f"{text}\n（{detail}）\n\n全部归入「{self.triage_category}」？之后可逐张撤销。"):
+                self.auto_assign(flagged, self.triage_category)
+        else:
+            messagebox.showinfo("自动预分", text)
+        self.load_image()
+
+    def auto_assign(self, flagged, category):
+        # 与手动分类一样写入移动日志/标签清单和撤销历史
+        for name, reason in flagged:
+            if name not in self.image_files or not self.claimed(name):
+                continue
+            pos = self.image_files.index(name)
+            op_id = self.mover.move(name, category, pos)
+            self.metrics.label(name, category, auto=reason)
+            self.history.append((name, pos, category, op_id))
+            self.image_files.remove(name)
+        self.index = min(self.index, max(0, len(self.image_files) - 1))
+
+    def start_dedup(self):
+        if not self.dedup_enabled or self.dedup_future is not None:
+            return
+        self.dedup_progress = [0, 0]
+
+        def progress(i, total):
+            self.dedup_progress = [i, total]
+
+        self.dedup_future = self.dedup_executor.submit(self._dedup_task, self.work_dir, list(self.image_files), self.dedup_distance, progress)
+
+    def _dedup_task(self, work_dir, names, max_distance, progress):
+        hashes, _ = build_index(work_dir, names, workers=self.dedup_workers, progress=progress, stop=self.background_stop)
+        return work_dir, hashes, cluster(hashes, max_distance)
+
+    def finish_dedup(self):
+        future, self.dedup_future = self.dedup_future, None
+        try:
+            work_dir, hashes, groups = future.result()
+        except Exception:
+            return
+        if work_dir != self.work_dir:
+            # 期间换了工作目录，重新建立
+            self.start_dedup()
+            return
+        self.clusters = {}
+        self.hashes = hashes
+        for members in groups:
+            for name in members:
+                self.clusters[name] = members
+        if self.img is not None and self.index < len(self.image_files):
+            self.update_status(self.image_files[self.index])
+
+    def cluster_of(self, name):
+        # 当前图片所在簇中仍待分类、且与当前图片距离不超过阈值的图片，当前图片排在最前
+        members = self.clusters.get(name)
+        if not members:
+            return [name]
+        own = self.hashes[name]
+        return [name] + [m for m in members if m != name and m in self.image_files
+                         and distance(self.hashes[m], own) <= self.dedup_distance]
+
+    def move_cluster(self, category):
+        if self.index >= len(self.image_files):
+            return
+        img_name = self.image_files[self.index]
+        members = [name for name in self.cluster_of(img_name) if name == img_name or self.claimed(name)]
+        if len(members) == 1:
+            self.move_image(category)
+            return
+        positions = [self.image_files.index(name) for name in members]
+        dwell = (time.perf_counter() - self.shown_at) * 1000 if self.shown_at else None
+        group = []
+        with self.metrics.stage('move', image=img_name, cluster=len(members)):
+            for name, pos in zip(members, positions):
+                op_id = self.mover.move(name, category, pos)
+                group.append((name, pos, category, op_id))
+        for name in members:
+            self.metrics.label(name, category, dwell if name == img_name else None, cluster=len(members))
+            self.image_files.remove(name)
+        # 整簇作为一步撤销
+        self.history.append(group)
+        self.index -= sum(1 for pos in positions[1:] if pos < self.index)
+        self.load_image()
+
+    def claimed(self, name):
+        return self.leases is None or self.leases.claim(name) == CLAIMED
+
+    def claim_current(self):
+        # 跳过他人正在处理或已经分完的图片，直到领到当前这张，并登记接下来要领取的一批
+        while self.index < len(self.image_files):
+            name = self.image_files[self.index]
+            status = self.leases.claim(name)
+            # 刚撤销的图片可能还在移回工作目录的路上
+            if status == CLAIMED or (status == GONE and self.mover.busy(name)):
+                end = min(len(self.image_files), self.index + self.lease_ahead)
+                self.leases.want([self.image_files[i] for i in range(self.index, end)])
+                return
+            self.image_files.remove(name)
+            self.total_count -= 1
+            if status == LEASED:
+                self.leased_elsewhere.add(name)
+
+    def reclaim_leases(self):
+        # 他人租约过期（如程序异常退出）后把这些图片放回自己的队列
+        self.lease_checked = time.monotonic()
+        current = self.image_files[self.index] if self.img is not None and self.index < len(self.image_files) else None
+        for name in list(self.leased_elsewhere):
+            state = self.leases.state(name)
+            if state == LEASED:
+                continue
+            self.leased_elsewhere.discard(name)
+            if state is None and name not in self.image_files:
+                self.image_files.restore(name)
+                self.total_count += 1
+        if current is not None:
+            self.index = self.image_files.index(current)
+            self.update_status(current)
+        elif self.img is None and self.waiting_for is None and self.index < len(self.image_files):
+            # 之前已经分完，接管的图片回到队列后继续
+            self.load_image()
+
+    def reset_prefetch(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        self.waiting_for = None
+        self.prefetch_gen += 1
+
+    def on_close(self):
+        self.reset_prefetch()
+        self.executor.shutdown(wait=False)
+        self.background_stop.set()
+        self.background.shutdown(wait=False, cancel_futures=True)
+        self.dedup_executor.shutdown(wait=False, cancel_futures=True)
+        # 等待排队中的移动全部落盘后再退出
+        if self.mover is not None:
+            self.mover.close()
+        self.metrics.close()
+        self.root.destroy()
+
+    def request_render(self, force_new_img=True):
+        # 只登记请求，每帧最多重绘一次
+        self.frame_stats['requests'] += 1
+        self.frame_force = self.frame_force or force_new_img
+        if self.frame_job is None:
+            self.frame_job = self.root.after(self.frame_ms, self._run_frame)
+        else:
+            self.frame_stats['coalesced'] += 1
+
+    def _run_frame(self):
+        self.frame_job = None
+        force_new_img = self.frame_force
+        self.frame_force = False
+        start = time.perf_counter()
+        # 连续操作期间用快速插值预览
+        self.render_image(force_new_img, resample=self.preview_resample)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.frame_stats['frames'] += 1
+        self.frame_stats['max_ms'] = max(self.frame_stats['max_ms'], elapsed)
+        if elapsed > self.frame_ms:
+            self.frame_stats['dropped'] += 1
+        if self.refine_job is not None:
+            self.root.after_cancel(self.refine_job)
+        self.refine_job = self.root.after(self.refine_delay_ms, self._refine)
+
+    def _refine(self):
+        # 操作停止一段时间后，用高质量插值重绘一次
+        self.refine_job = None
+        if self.render_resample != self.resample_method:
+            self.frame_stats['refines'] += 1
+            self.render_image(force_new_img=True)
+
+    def show_render_stats(self):
+        stats = self.frame_stats
+        cache = self.label_cache.stats()
+        disk = self.disk_cache.stats() if self.disk_cache else None
+        messagebox.showinfo("渲染统计",
+                            f"重绘请求 {stats['requests']}，实际重绘 {stats['frames']}，合并 {stats['coalesced']}\n"
+                            f"超出帧预算({self.frame_ms}ms) {stats['dropped']}，最长 {stats['max_ms']:.1f}ms，高质量重绘 {stats['refines']}\n"
+                            f"缓存命中 {cache['hits']}，未命中 {cache['misses']}，淘汰 {cache['evictions']}，"
+                            f"占用 {cache['bytes'] / 1024 / 1024:.0f}/{cache['max_bytes'] / 1024 / 1024:.0f}MB"
+                            + (f"\n磁盘缓存命中 {disk['hits']}，未命中 {disk['misses']}，淘汰 {disk['evictions']}" if disk else ""))
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self.draw_overlay()
+
+    def draw_overlay(self):
+        # 画布左上角显示本张延迟、滚轮 p50/p95、各阶段 p95 和标注速度
+        self.canvas.delete('overlay')
+        if not self.show_overlay:
+            return
+        image = self.metrics.summary('image')
+        stages = "  ".join(f"{label} {self.metrics.summary(stage)['p95']:.0f}"
+                           for stage, label in (('disk_read', '读缓存'), ('decode', '解码'), ('split', '切分'),
+                                                ('assemble', '拼图'), ('resample', '缩放'), ('photo', 'PhotoImage')))
+        text = (f"本张 {image['last']:.0f}ms  p50 {image['p50']:.0f}ms  p95 {image['p95']:.0f}ms\n"
+                f"p95(ms) {stages}\n"
+                f"已标注 {self.metrics.labels} 张  {self.metrics.labels_per_hour():.0f} 张/小时")
+        self.canvas.create_text(10, 10, anchor='nw', text=text, fill="#F5F6FA", font=("SegoeUI", 10), tags='overlay')
+
+    def render_image(self, force_new_img=True, resample=None):
         if self.img is None:
             return
         w = self.canvas.winfo_width()
         h = self.canvas.winfo_height()
         # 如果窗口未布局好，延迟重绘，保证图片居中
         if w < 100 or h < 100:
-            self.root.after(50, lambda: self.render_image(force_new_img))
+            self.root.after(50, lambda: self.render_image(force_new_img, resample))
             return
-        img_w, img_h = self.img.size
-        scale = self.scale
-        max_w = int(w * scale)
-        max_h = int(h * scale)
-        ratio = min(max_w / img_w, max_h / img_h, 1.0 * scale)
-        new_size = (max(1, int(img_w * ratio)), max(1, int(img_h * ratio)))
-        if force_new_img or self.tk_img is None or self.tk_img.width() != new_size[0] or self.tk_img.height() != new_size[1]:
-            img_resized = self.img.resize(new_size, self.resample_method)
-            self.tk_img = ImageTk.PhotoImage(img_resized)
+        if resample is None:
+            resample = self.resample_method
+        new_size, left, top, visible = view_geometry(self.pyramid.full_size, (w, h), self.scale, (self.offset_x, self.offset_y))
+        if visible[0] >= visible[2] or visible[1] >= visible[3]:
             self.canvas.delete('all')
-            # 计算中心点+偏移
-            cx = w // 2 + self.offset_x
-            cy = h // 2 + self.offset_y
-            self.canvas_img = self.canvas.create_image(cx, cy, image=self.tk_img)
+            self.tk_img = None
+            return
+        if force_new_img or self.tk_img is None or self.render_size != new_size or not box_contains(self.render_box, visible):
+            # 只重采样可见区域（四周各多留四分之一画布，便于平移时直接移动）
+            margin_x, margin_y = w // 4, h // 4
+            box = (max(0, visible[0] - margin_x), max(0, visible[1] - margin_y),
+                   min(new_size[0], visible[2] + margin_x), min(new_size[1], visible[3] + margin_y))
+            if self.pyramid.reduced and self.pyramid[0].width < new_size[0]:
+                self.request_full_res()
+            with self.metrics.stage('resample', scale=round(self.scale, 3), preview=resample != self.resample_method):
+                img_resized = render_box(self.pyramid, new_size, box, resample)
+            with self.metrics.stage('photo'):
+                self.tk_img = ImageTk.PhotoImage(img_resized)
+            self.canvas.delete('all')
+            self.canvas_img = self.canvas.create_image(left + box[0], top + box[1], image=self.tk_img, anchor='nw')
+            self.render_box = box
+            self.render_size = new_size
+            self.render_resample = resample
+            self.draw_overlay()
+            if self.startup_pending:
+                # 排在本次重绘之后执行
+                self.startup_pending = False
+                self.root.after_idle(self.finish_startup)
         else:
-            # 只移动图片
-            cx = w // 2 + self.offset_x
-            cy = h // 2 + self.offset_y
-            self.canvas.coords(self.canvas_img, cx, cy)
+            # 已渲染区域覆盖可见区域，只移动图片
+            self.canvas.coords(self.canvas_img, left + self.render_box[0], top + self.render_box[1])
 
     def on_drag_start(self, event):
         self.drag_data['x'] = event.x
@@ -390,15 +1116,21 @@ class ImageSorter:
         self.drag_data['x'] = event.x
         self.drag_data['y'] = event.y
         # 只移动canvas图片，不重建tk_img
-        self.render_image(force_new_img=False)
+        self.request_render(force_new_img=False)
 
     def on_drag_end(self, event):
         self.drag_data['dragging'] = False
 
     def move_image(self, category):
+        if self.index >= len(self.image_files):
+            return
         img_name = self.image_files[self.index]
-        self.history.append((img_name, self.index, category))
-        shutil.move(os.path.join(self.work_dir, img_name), os.path.join(self.work_dir, category, img_name))
+        # 移动交给后台队列，界面直接切到下一张
+        with self.metrics.stage('move', image=img_name):
+            op_id = self.mover.move(img_name, category, self.index)
+        dwell = (time.perf_counter() - self.shown_at) * 1000 if self.shown_at else None
+        self.metrics.label(img_name, category, dwell)
+        self.history.append((img_name, self.index, category, op_id))
         del self.image_files[self.index]
         self.load_image()
 
@@ -406,24 +1138,25 @@ class ImageSorter:
         if not self.history:
             messagebox.showinfo("提示", "没有可撤销的操作！")
             return
-        last_img, last_index, last_category = self.history.pop()
-        src = os.path.join(self.work_dir, last_category, last_img)
-        dst = os.path.join(self.work_dir, last_img)
-        if os.path.exists(src):
-            shutil.move(src, dst)
-        if last_img in self.image_files:
-            self.image_files.remove(last_img)
-        self.image_files.insert(last_index, last_img)
-        self.index = last_index
+        entry = self.history.pop()
+        group = entry if isinstance(entry, list) else [entry]
+        with self.metrics.stage('undo', image=group[0][0], cluster=len(group)):
+            for last_img, last_index, last_category, op_id in reversed(group):
+                self.mover.undo(op_id, last_img, last_category)
+        for last_img, last_index, last_category, op_id in group:
+            self.metrics.unlabel(last_img, last_category)
+            # 放回队列中原来的位置
+            self.image_files.restore(last_img)
+        self.index = self.image_files.index(group[0][0])
         self.load_image()
 
     def ctrl_plus(self, event=None):
         self.scale = min(self.max_scale, self.scale * 1.1)
-        self.render_image(force_new_img=True)
+        self.request_render(force_new_img=True)
 
     def ctrl_minus(self, event=None):
         self.scale = max(self.min_scale, self.scale / 1.1)
-        self.render_image(force_new_img=True)
+        self.request_render(force_new_img=True)
 
     def ctrl_mousewheel(self, event):
         pass  # 兼容保留，不再绑定
@@ -433,15 +1166,30 @@ class ImageSorter:
         webbrowser.open('https://github.com/jdhnsu')
 
     def on_resize(self, event):
-        self.render_image(force_new_img=True)
+        self.request_render(force_new_img=True)
 
     def arrow_pan(self, dx, dy):
         self.offset_x += dx
         self.offset_y += dy
-        self.render_image(force_new_img=False)
+        self.request_render(force_new_img=False)
 
-# 运行程序
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="图片分类工具")
+    parser.add_argument('--workdir', help="直接打开该工作目录，跳过目录和开始图片选择")
+    parser.add_argument('--label-only', action='store_true', help="仅记录标签模式（配合 --workdir）")
+    parser.add_argument('--shared', action='store_true', help="多人协作模式（配合 --workdir）")
+    parser.add_argument('--measure-startup', nargs='?', const='-', metavar='FILE',
+                        help="显示第一张图片后把启动耗时（JSON）写到 FILE（默认标准输出）并退出")
+    args = parser.parse_args(argv)
     root = tk.Tk()
     app = ImageSorter(root)
+    app.measure_startup = args.measure_startup
+    if args.workdir:
+        app.skip_selectors(args.workdir, args.label_only, args.shared)
     root.mainloop()
+
+# 运行程序
+if __name__ == "__main__":
+    # 自动预分使用进程池，打包成 exe 后子进程需要这一步
+    multiprocessing.freeze_support()
+    main()
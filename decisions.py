@@ -0,0 +1,181 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 仅标注模式下的标签清单，每行一条 JSON 记录
+MANIFEST_NAME = 'piexl_labels.jsonl'
+APPLY_MODES = ('move', 'copy', 'link')
+
+
+def default_manifest_path(work_dir, name=MANIFEST_NAME):
+    # 工作目录可写时放在目录内，只读数据集则放到用户目录下
+    if os.access(work_dir, os.W_OK):
+        return os.path.join(work_dir, name)
+    digest = hashlib.sha1(os.path.abspath(work_dir).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(os.path.expanduser('~'), '.piexl', f'{digest}_{name.lstrip(".")}')
+
+
+def read_manifest(manifest_path):
+    # 返回仍然有效的标签记录 {id: record}，按记录顺序排列
+    labels = {}
+    if not os.path.exists(manifest_path):
+        return labels
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('op') == 'undo':
+                labels.pop(record['ref'], None)
+            else:
+                labels[record['id']] = record
+    return labels
+
+
+class LabelRecorder:
+    # 与 MoveQueue 接口相同，但分类键只把决定写进清单，不碰图片文件
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.next_id = 1
+        self.moved = 0
+
+    def _append(self, record):
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def recover(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        labels = read_manifest(self.manifest_path)
+        # 撤销记录也占用编号，需要扫描全部记录取最大值
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.next_id = max(self.next_id, json.loads(line)['id'] + 1)
+                    except (ValueError, KeyError):
+                        continue
+        return [(r['name'], r['index'], r['category'], op_id) for op_id, r in labels.items()]
+
+    def start(self):
+        pass
+
+    def move(self, name, category, index):
+        op_id = self.next_id
+        self.next_id += 1
+        self._append({'id': op_id, 'name': name, 'category': category, 'index': index, 'time': time.time()})
+        self.moved += 1
+        return op_id
+
+    def undo(self, op_id, name, category):
+        undo_id = self.next_id
+        self.next_id += 1
+        self._append({'id': undo_id, 'op': 'undo', 'ref': op_id, 'name': name, 'category': category})
+        return undo_id
+
+    def busy(self, name):
+        return False
+
+    def wait(self, name, timeout=None):
+        return True
+
+    def flush(self, timeout=None):
+        return True
+
+    def pop_failures(self):
+        return []
+
+    def close(self, timeout=None):
+        pass
+
+
+def _apply_one(mode, src, dst):
+    if not os.path.exists(src):
+        # 已经应用过（例如重复执行 move）时跳过
+        if os.path.exists(dst):
+            return 'skipped'
+        raise FileNotFoundError(src)
+    same = os.path.exists(dst) and os.path.samefile(src, dst)
+    if mode == 'move':
+        # 之前用硬链接应用过时目标已是同一文件，rename 不会生效，直接删除源文件
+        if same:
+            os.remove(src)
+        else:
+            shutil.move(src, dst)
+    elif same or (mode == 'link' and os.path.exists(dst)):
+        return 'skipped'
+    elif mode == 'copy':
+        shutil.copy2(src, dst)
+    else:
+        os.link(src, dst)
+    return 'done'
+
+
+def apply_decisions(work_dir, manifest_path=None, mode='move', dest_dir=None, workers=8):
+    # 按清单批量执行移动/复制/硬链接，返回统计信息
+    if mode not in APPLY_MODES:
+        raise ValueError(f"未知的应用方式: {mode}")
+    manifest_path = manifest_path or default_manifest_path(work_dir)
+    dest_dir = dest_dir or work_dir
+    # 同一张图片以最后一次标注为准
+    latest = {}
+    for record in read_manifest(manifest_path).values():
+        latest[record['name']] = record['category']
+    for category in set(latest.values()):
+        os.makedirs(os.path.join(dest_dir, category), exist_ok=True)
+    counts = {'done': 0, 'skipped': 0}
+    failures = []
+    lock = threading.Lock()
+
+    def run(item):
+        name, category = item
+        try:
+            result = _apply_one(mode, os.path.join(work_dir, name), os.path.join(dest_dir, category, name))
+        except OSError as e:
+            with lock:
+                failures.append((name, str(e)))
+            return
+        with lock:
+            counts[result] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(run, latest.items()))
+    elapsed = time.perf_counter() - start
+    return {
+        'total': len(latest),
+        'done': counts['done'],
+        'skipped': counts['skipped'],
+        'failures': failures,
+        'seconds': elapsed,
+        'per_second': counts['done'] / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按标签清单批量整理图片")
+    sub = parser.add_subparsers(dest='command', required=True)
+    apply_parser = sub.add_parser('apply', help="执行清单中的分类")
+    apply_parser.add_argument('work_dir', help="图片工作目录")
+    apply_parser.add_argument('--manifest', help="标签清单路径，默认自动查找")
+    apply_parser.add_argument('--mode', choices=APPLY_MODES, default='move', help="移动/复制/硬链接")
+    apply_parser.add_argument('--dest', help="输出目录，默认为工作目录")
+    apply_parser.add_argument('--workers', type=int, default=8, help="并行线程数")
+    args = parser.parse_args(argv)
+    stats = apply_decisions(args.work_dir, args.manifest, args.mode, args.dest, args.workers)
+    print(f"共 {stats['total']} 张，完成 {stats['done']}，跳过 {stats['skipped']}，失败 {len(stats['failures'])}，"
+          f"耗时 {stats['seconds']:.2f}s（{stats['per_second']:.1f} 张/秒）")
+    for name, err in stats['failures']:
+        print(f"  失败 {name}: {err}")
+    return 1 if stats['failures'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
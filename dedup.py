@@ -0,0 +1,157 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+from PIL import Image
+
+from composite import decode_scaled, to_gray
+from decisions import default_manifest_path
+from triage import file_key, run_incremental
+from work_queue import get_image_files
+
+# 感知哈希索引保存在工作目录下，下次打开时只计算新增或修改过的图片
+INDEX_NAME = '.piexl_phash.json'
+# 汉明距离不超过该值的两张图视为近似重复
+MAX_DISTANCE = 6
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] *= np.sqrt(1 / n)
+    m[1:] *= np.sqrt(2 / n)
+    return m
+
+
+DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(big):
+    # 整张三联图（含掩码）缩到 32x32 灰度做二维 DCT，取左上 8x8 低频（去掉直流分量）与中位数比较，得到 64 位哈希
+    small = np.asarray(Image.fromarray(to_gray(big)).resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (DCT @ small @ DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def popcount(x):
+    # uint64 数组逐元素数 1 的个数
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def _hash_one(path):
+    name = os.path.basename(path)
+    try:
+        big, _ = decode_scaled(path, (256, 256))
+        return name, {'key': file_key(path), 'hash': f"{phash(big):016x}"}, None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def load_index(index_path):
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            return json.load(f).get('items', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index_path, items):
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp = index_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'items': items}, f)
+    os.replace(tmp, index_path)
+
+
+def build_index(work_dir, names=None, index_path=None, workers=None, progress=None, stop=None):
+    # 增量更新哈希索引：未变化的图片复用已保存的哈希，其余并行计算；返回 ({文件名: 哈希}, 失败列表)
+    index_path = index_path or default_manifest_path(work_dir, INDEX_NAME)
+    names = list(get_image_files(work_dir) if names is None else names)
+    saved = load_index(index_path)
+    items, failures, computed = run_incremental(work_dir, names, saved, _hash_one, workers=workers or max(1, (os.cpu_count() or 2) - 1),
+                                                progress=progress, stop=stop)
+    if computed:
+        # 中途停止时已算好的部分也保存下来
+        save_index(index_path, saved)
+    return {name: int(item['hash'], 16) for name, item in items.items()}, failures
+
+
+def cluster(hashes, max_distance=MAX_DISTANCE):
+    # 把 64 位哈希分成 max_distance+1 段，距离不超过 max_distance 的两张图至少有一段完全相同（抽屉原理）
+    # 只比较同一段落在同一桶里的候选对，得到每张图的近邻；再按近邻数从多到少选代表，代表和它尚未归簇的近邻组成一簇
+    # 不做传递合并，簇内每张图与代表的距离都不超过 max_distance；返回 [[代表, 文件名, ...], ...]，只包含两张以上的簇
+    names = list(hashes)
+    if len(names) < 2:
+        return []
+    values = np.array([hashes[name] for name in names], dtype=np.uint64)
+    neighbors = defaultdict(set)
+    blocks = min(64, max_distance + 1)
+    edges = np.linspace(0, 64, blocks + 1).astype(int)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        keys = (values >> np.uint64(lo)) & np.uint64((1 << (hi - lo)) - 1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        bounds = np.flatnonzero(np.diff(sorted_keys)) + 1
+        for bucket in np.split(order, bounds):
+            if len(bucket) < 2:
+                continue
+            # 桶很大时分块比较，避免一次生成过大的距离矩阵
+            for start in range(0, len(bucket), 1024):
+                rows = bucket[start:start + 1024]
+                dist = popcount(values[rows][:, None] ^ values[bucket][None, :])
+                for r, c in zip(*np.nonzero(dist <= max_distance)):
+                    a, b = int(rows[r]), int(bucket[c])
+                    if a != b:
+                        neighbors[a].add(b)
+    assigned = set()
+    groups = []
+    for i in sorted(neighbors, key=lambda i: (-len(neighbors[i]), i)):
+        if i in assigned:
+            continue
+        members = [j for j in sorted(neighbors[i]) if j not in assigned]
+        if not members:
+            continue
+        assigned.add(i)
+        assigned.update(members)
+        groups.append([names[i]] + [names[j] for j in members])
+    return groups
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="建立感知哈希索引并列出近似重复的图片")
+    parser.add_argument('work_dir', help="图片工作目录")
+    parser.add_argument('--workers', type=int, help="进程数，默认 CPU 数减一")
+    parser.add_argument('--distance', type=int, default=MAX_DISTANCE, help="汉明距离阈值")
+    parser.add_argument('--list', action='store_true', help="列出每个簇中的文件")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    hashes, failures = build_index(args.work_dir, workers=args.workers)
+    groups = cluster(hashes, args.distance)
+    elapsed = time.perf_counter() - start
+    duplicates = sum(len(members) for members in groups)
+    print(f"共 {len(hashes)} 张，{len(groups)} 个近似重复簇（{duplicates} 张），失败 {len(failures)}，耗时 {elapsed:.2f}s")
+    if args.list:
+        for members in sorted(groups, key=len, reverse=True):
+            print(f"  {len(members)} 张: {', '.join(sorted(members))}")
+    for name, err in failures:
+        print(f"  失败 {name}: {err}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+import hashlib
+import io
+import math
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from composite import Parts, assemble_layout, compose_levels, to_gray
+
+LAYOUTS = ('grid', 'row')
+# 默认放在工作目录下的隐藏文件夹
+CACHE_DIR_NAME = '.piexl_cache'
+CACHE_EXT = '.npz'
+# 缓存文件格式版本，写入键中，格式变化后旧文件自然失效并按最近使用时间被淘汰
+CACHE_VERSION = 2
+# 展示图的 JPEG 质量，不做色度抽样以免红色标注边缘发虚
+JPEG_QUALITY = 90
+
+
+def cache_salt(threshold, alpha, color):
+    # 叠加参数不同，生成的标注图也不同，需要区分缓存
+    return f"{threshold}|{alpha}|{tuple(color)}"
+
+
+class DiskCache:
+    # 持久化的展示分辨率缓存：每张图片只保存一张缩小到两种排版长边都不超过 max_side 的 1x4 横排 JPEG
+    # 读取时切回四张分图再拼出两种排版的金字塔，单张约 0.2~0.5MB（原先存全部层的原始像素约 8~11MB）
+    # 以 路径+大小+修改时间+叠加参数 作为键，总大小超过 max_bytes 时按最近使用时间淘汰
+    # 读取只打开对应的一个文件；淘汰用的大小索引在第一次写入时由后台线程扫描建立
+    def __init__(self, cache_dir, max_bytes, max_side=2048, salt=''):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.salt = salt
+        self.lock = threading.Lock()
+        self.index = None
+        # 索引建立前的读写先记在这里，扫描完成后合并：{文件: [大小或 None, 使用时间]}
+        self.pending = {}
+        self.scanner = None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, path):
+        st = os.stat(path)
+        raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{self.salt}|v{CACHE_VERSION}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + CACHE_EXT)
+
+    def _scan(self):
+        # 扫描缓存目录时不持锁，读写照常进行；扫描结果与期间的读写记录合并后再按上限淘汰
+        index = {}
+        if os.path.isdir(self.cache_dir):
+            for sub in os.scandir(self.cache_dir):
+                if not sub.is_dir():
+                    continue
+                for entry in os.scandir(sub.path):
+                    if entry.name.endswith(CACHE_EXT):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        index[entry.path] = [st.st_size, st.st_mtime]
+        with self.lock:
+            for file, (size, used) in self.pending.items():
+                if size is not None:
+                    index[file] = [size, used]
+                elif file in index:
+                    index[file][1] = used
+            self.pending = {}
+            self.index = index
+            self.total_bytes = sum(size for size, _ in index.values())
+            self._evict()
+
+    def _start_scan(self):
+        # 调用时需持有 self.lock；没有上限时（如批量预处理）不需要索引
+        if self.index is not None or self.scanner is not None or math.isinf(self.max_bytes):
+            return
+        self.scanner = threading.Thread(target=self._scan, daemon=True)
+        self.scanner.start()
+
+    def _note(self, file, size, used):
+        # 调用时需持有 self.lock
+        if self.index is None:
+            old = self.pending.get(file)
+            if size is None and old is not None:
+                size = old[0]
+            self.pending[file] = [size, used]
+            return
+        old = self.index.get(file)
+        if size is None:
+            if old is not None:
+                old[1] = used
+            return
+        if old:
+            self.total_bytes -= old[0]
+        self.index[file] = [size, used]
+        self.total_bytes += size
+        self._evict()
+
+    def get(self, path, layout_modes=LAYOUTS):
+        # 返回 (分图, {排版: Pyramid})，只拼 layout_modes 中的排版，其余排版之后可由分图拼出；未命中或文件损坏时返回 None
+        try:
+            file = self._file(self.key(path))
+            with np.load(file) as data:
+                widths = [int(v) for v in data['widths']]
+                full_size = tuple(int(v) for v in data['full_size'])
+                row = np.asarray(Image.open(io.BytesIO(data['row'].tobytes())).convert('RGB'))
+            edges = np.cumsum([0] + widths)
+            orig, mask, label, crop = (row[:, edges[i]:edges[i + 1]] for i in range(4))
+            parts = Parts((orig, to_gray(mask), label, crop), full_size)
+            layouts = {layout_mode: compose_levels(parts, layout_mode) for layout_mode in layout_modes}
+        except Exception:
+            with self.lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(file)
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+            self._note(file, None, time.time())
+        return parts, layouts
+
+    def contains(self, path):
+        try:
+            return os.path.exists(self._file(self.key(path)))
+        except OSError:
+            return False
+
+    def touch(self, path):
+        # 已有缓存时更新使用时间并返回文件大小，没有时返回 None
+        try:
+            file = self._file(self.key(path))
+            os.utime(file)
+            return os.path.getsize(file)
+        except OSError:
+            return None
+
+    def put(self, path, parts):
+        # 分图已缩小解码时 full_size 记录原始尺寸，读取后仍能判断是否需要按原图重新解码
+        orig, mask, label, crop = parts
+        h = mask.shape[0]
+        widths = [orig.shape[1], mask.shape[1], label.shape[1], crop.shape[1]]
+        full_size = getattr(parts, 'full_size', None) or (widths[0] + widths[1] + widths[3], h)
+        # 横排最宽、宫格最高，两者都缩到 max_side 以内
+        factor = math.ceil(max(sum(widths), h * 2) / self.max_side)
+        if factor > 1:
+            parts = [np.asarray(Image.fromarray(part).reduce(factor)) for part in parts]
+            widths = [part.shape[1] for part in parts]
+        buf = io.BytesIO()
+        assemble_layout(parts, 'row').save(buf, 'JPEG', quality=JPEG_QUALITY, subsampling=0)
+        arrays = {
+            'row': np.frombuffer(buf.getvalue(), dtype=np.uint8),
+            'widths': np.array(widths),
+            'full_size': np.array(full_size),
+        }
+        file = self._file(self.key(path))
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        # 先写临时文件再替换，避免中途退出留下半个缓存文件
+        tmp = f'{file}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, file)
+        st = os.stat(file)
+        with self.lock:
+            self._note(file, st.st_size, st.st_mtime)
+            self._start_scan()
+        return st.st_size
+
+    def trim(self):
+        # 重新扫描缓存目录并按上限淘汰（多个进程同时写入后使用）
+        with self.lock:
+            self.index = None
+        self._scan()
+
+    def _evict(self):
+        # 超出上限时删除最久未使用的文件，直到降到上限的 90%
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for file, (size, _) in sorted(self.index.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            del self.index[file]
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.index if self.index is not None else self.pending),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,296 @@
+import getpass
+import json
+import os
+import socket
+import threading
+import time
+
+# 多人同时处理同一个共享目录时的租约目录：每张图片一个租约文件，分类后换成完成标记
+# 每个实例另有一个 .alive 文件占用实例编号，同时用于统计在线人数
+LEASE_DIR_NAME = '.piexl_leases'
+LEASE_EXT = '.lease'
+DONE_EXT = '.done'
+ALIVE_EXT = '.alive'
+# 租约有效期，持有者每隔 ttl/4 刷新一次修改时间；超过有效期未刷新（如程序崩溃）的租约可被其他人接管
+LEASE_TTL = 120
+
+CLAIMED = 'claimed'
+LEASED = 'leased'
+DONE = 'done'
+GONE = 'gone'
+
+
+def annotator_id():
+    # 同一台机器上同一用户的固定标识，用于区分各自的移动日志和标签清单
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'user'
+    return f"{socket.gethostname()}-{user}"
+
+
+class LeaseManager:
+    # 通过租约文件协调多个实例：用 O_EXCL 创建保证同一张图片只有一个实例能领到
+    # 租约文件里记录持有者，刷新、删除和确认持有之前都先核对，过期后被别人接管的租约不会再当成自己的
+    # 后台线程定时刷新自己的租约、预先领取接下来要看的一批图片，并统计所有人的进度
+    def __init__(self, work_dir, ttl=LEASE_TTL):
+        self.work_dir = work_dir
+        self.lease_dir = os.path.join(work_dir, LEASE_DIR_NAME)
+        self.ttl = ttl
+        self.owner = f"{annotator_id()}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.claim_lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.owned = set()
+        self.slot = None
+        self.wanted = []
+        self.closed = False
+        self.thread = None
+        self.annotators = 1
+        self.done_count = 0
+        os.makedirs(self.lease_dir, exist_ok=True)
+
+    def _path(self, name, ext=LEASE_EXT):
+        return os.path.join(self.lease_dir, name + ext)
+
+    def _expired(self, path):
+        try:
+            return time.time() - os.path.getmtime(path) > self.ttl
+        except OSError:
+            return True
+
+    def _create(self, path):
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'owner': self.owner, 'time': time.time()}, f)
+
+    def _owner(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f).get('owner')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _acquire(self, path):
+        # 创建租约文件，已有的租约过期时接管；成功或本来就归自己时返回 True
+        # 返回 False 只表示别人持有未过期的租约，其他错误（如目录不可写）直接抛出
+        for _ in range(2):
+            try:
+                self._create(path)
+            except FileExistsError:
+                if self._owner(path) == self.owner:
+                    return True
+                if not self._expired(path):
+                    return False
+                # 过期租约先改名再删除，改名是原子的，同时接管时只有一个实例能成功
+                stale = f"{path}.{self.owner}.stale"
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    # 别人抢先接管或删掉了，重新尝试创建
+                    continue
+                if not self._expired(stale):
+                    # 改名前别人刚好接管并写了新租约，还给对方
+                    try:
+                        os.link(stale, path)
+                    except OSError:
+                        pass
+                    os.remove(stale)
+                    return False
+                os.remove(stale)
+                continue
+            return True
+        return False
+
+    def take_slot(self):
+        # 占用一个实例编号（主机名-用户名-序号），同一用户在同一台机器上开多个实例时各用各的移动日志和标签清单
+        # 实例异常退出后编号在租约过期后可以重新占用，届时回放它留下的日志
+        n = 1
+        while not self._acquire(self._path(f"{annotator_id()}-{n}", ALIVE_EXT)):
+            n += 1
+        self.slot = f"{annotator_id()}-{n}"
+        return self.slot
+
+    def claim(self, name, check_file=True):
+        # 返回 CLAIMED（归自己）、LEASED（他人持有）、DONE（已被分类）或 GONE（文件已不在工作目录）
+        path = self._path(name)
+        with self.lock:
+            owned = name in self.owned
+        if owned:
+            if self._owner(path) == self.owner:
+                return CLAIMED
+            # 自己的租约过期后被别人接管了
+            with self.lock:
+                self.owned.discard(name)
+        if os.path.exists(self._path(name, DONE_EXT)):
+            return DONE
+        if check_file and not os.path.exists(os.path.join(self.work_dir, name)):
+            return GONE
+        # 界面线程和后台线程可能同时领取同一张，串行执行，避免把自己刚领到的当成别人的
+        with self.claim_lock:
+            try:
+                if not self._acquire(path):
+                    return LEASED
+            except OSError:
+                return LEASED
+            with self.lock:
+                self.owned.add(name)
+        return CLAIMED
+
+    def release(self, name):
+        with self.lock:
+            if name not in self.owned:
+                return
+            self.owned.discard(name)
+        self._remove_own(self._path(name))
+
+    def _remove_own(self, path):
+        # 只删除自己持有的租约，过期后已被别人接管的留给对方
+        if self._owner(path) != self.owner:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def finish(self, name):
+        # 分类后写完成标记，其他实例不会再领取这张图片
+        try:
+            with open(self._path(name, DONE_EXT), 'w', encoding='utf-8') as f:
+                json.dump({'owner': self.owner, 'time': time.time()}, f)
+        except OSError:
+            pass
+        self.release(name)
+
+    def reopen(self, name):
+        # 撤销后去掉完成标记，重新由自己持有
+        try:
+            os.remove(self._path(name, DONE_EXT))
+        except OSError:
+            pass
+        with self.lock:
+            self.owned.discard(name)
+        # 移动模式下文件可能还在移回工作目录的路上
+        self.claim(name, check_file=False)
+
+    def state(self, name):
+        # 不领取，只查看状态：DONE、GONE、LEASED（他人持有且未过期）或 None（可以领取）
+        if os.path.exists(self._path(name, DONE_EXT)):
+            return DONE
+        if not os.path.exists(os.path.join(self.work_dir, name)):
+            return GONE
+        path = self._path(name)
+        if os.path.exists(path) and not self._expired(path):
+            return LEASED
+        return None
+
+    def want(self, names):
+        # 界面线程登记接下来要看的图片，由后台线程预先领取；窗口外自己持有的租约会被释放
+        with self.cond:
+            self.wanted = list(names)
+            self.cond.notify()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _claim_wanted(self):
+        with self.lock:
+            wanted = list(self.wanted)
+            owned = list(self.owned)
+        keep = set(wanted)
+        for name in owned:
+            if name not in keep:
+                self.release(name)
+        for name in wanted:
+            if self.closed:
+                return
+            self.claim(name)
+
+    def _heartbeat(self):
+        with self.lock:
+            owned = list(self.owned)
+        for name in owned:
+            path = self._path(name)
+            if self._owner(path) == self.owner:
+                try:
+                    os.utime(path)
+                    continue
+                except OSError:
+                    pass
+            # 租约过期后被别人接管或删掉了，下次需要时重新领取
+            with self.lock:
+                self.owned.discard(name)
+        if self.slot is not None:
+            path = self._path(self.slot, ALIVE_EXT)
+            if self._owner(path) == self.owner:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+        annotators = 0
+        done = 0
+        with os.scandir(self.lease_dir) as it:
+            for entry in it:
+                if entry.name.endswith(DONE_EXT):
+                    done += 1
+                elif entry.name.endswith(ALIVE_EXT) and not self._expired(entry.path):
+                    annotators += 1
+        self.annotators = max(1, annotators)
+        self.done_count = done
+
+    def _run(self):
+        # 有新的 want 时立即领取；刷新租约和统计进度每 ttl/4 做一次
+        last_beat = 0.0
+        while True:
+            try:
+                self._claim_wanted()
+                if time.monotonic() - last_beat >= self.ttl / 4:
+                    self._heartbeat()
+                    last_beat = time.monotonic()
+            except OSError:
+                pass
+            with self.cond:
+                if self.closed:
+                    return
+                self.cond.wait(self.ttl / 4)
+                if self.closed:
+                    return
+
+    def progress(self):
+        return {'annotators': self.annotators, 'done': self.done_count}
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join(5)
+        for name in list(self.owned):
+            self.release(name)
+        if self.slot is not None:
+            self._remove_own(self._path(self.slot, ALIVE_EXT))
+
+
+class SharedMover:
+    # 包装 MoveQueue / LabelRecorder：分类时写完成标记，撤销时重新领取，其余接口原样转发
+    def __init__(self, mover, leases):
+        self.mover = mover
+        self.leases = leases
+
+    def __getattr__(self, attr):
+        return getattr(self.mover, attr)
+
+    def move(self, name, category, index):
+        op_id = self.mover.move(name, category, index)
+        self.leases.finish(name)
+        return op_id
+
+    def undo(self, op_id, name, category):
+        result = self.mover.undo(op_id, name, category)
+        self.leases.reopen(name)
+        return result
+
+    def close(self, timeout=None):
+        self.mover.close(timeout)
+        self.leases.close()
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# 默认的会话日志目录
+LOG_DIR = os.path.join(os.path.expanduser('~'), '.piexl', 'logs')
+
+
+def process_age():
+    # 当前进程从创建到现在经过的秒数，取不到时返回 None
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            times = [wintypes.FILETIME() for _ in range(4)]
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), *(ctypes.byref(t) for t in times)):
+                return None
+            # FILETIME 为 1601 年起的 100 纳秒数
+            ticks = (times[0].dwHighDateTime << 32) | times[0].dwLowDateTime
+            return time.time() - (ticks / 1e7 - 11644473600)
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except Exception:
+        return None
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class Metrics:
+    # 各阶段耗时统计：保留最近 window 次用于滚动 p50/p95，同时逐条写入本次会话的 JSONL 日志
+    # 可在后台线程中调用
+    def __init__(self, log_dir=LOG_DIR, window=200):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.start = time.time()
+        self.labels = 0
+        self.log = None
+        self.log_path = None
+        if log_dir:
+            try:
+                os.makedirs(log_dir, exist_ok=True)
+                self.log_path = os.path.join(log_dir, time.strftime('session-%Y%m%d-%H%M%S.jsonl'))
+                self.log = open(self.log_path, 'a', encoding='utf-8', buffering=1)
+            except OSError:
+                self.log = None
+        self.event('session_start', pid=os.getpid())
+
+    def event(self, kind, **fields):
+        if self.log is None:
+            return
+        record = {'t': round(time.time(), 3), 'event': kind}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.log is not None:
+                self.log.write(line)
+
+    def record(self, stage, ms, **fields):
+        with self.lock:
+            self.samples[stage].append(ms)
+            self.counts[stage] += 1
+        self.event('stage', stage=stage, ms=round(ms, 3), **fields)
+
+    @contextmanager
+    def stage(self, stage, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000, **fields)
+
+    def label(self, image, category, dwell_ms=None, **fields):
+        with self.lock:
+            self.labels += 1
+        self.event('label', image=image, category=category,
+                   dwell_ms=None if dwell_ms is None else round(dwell_ms, 1), **fields)
+
+    def unlabel(self, image, category):
+        with self.lock:
+            self.labels -= 1
+        self.event('undo', image=image, category=category)
+
+    def labels_per_hour(self):
+        hours = (time.time() - self.start) / 3600
+        return self.labels / hours if hours > 0 else 0.0
+
+    def summary(self, stage):
+        with self.lock:
+            values = list(self.samples.get(stage, ()))
+        return {
+            'count': self.counts.get(stage, 0),
+            'last': values[-1] if values else 0.0,
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+        }
+
+    def summaries(self):
+        with self.lock:
+            stages = list(self.samples)
+        return {stage: self.summary(stage) for stage in stages}
+
+    def close(self):
+        self.event('session_end', labels=self.labels, labels_per_hour=round(self.labels_per_hour(), 1),
+                   seconds=round(time.time() - self.start, 1), stages=self.summaries())
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
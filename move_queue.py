@@ -0,0 +1,201 @@
+import errno
+import json
+import os
+import shutil
+import threading
+
+# 预写日志放在工作目录下，记录每次移动/撤销的意图和完成情况
+JOURNAL_NAME = '.piexl_journal.jsonl'
+# 移动途中的临时文件后缀，放在目标目录下，以 . 开头
+PART_EXT = '.piexl_part'
+
+
+class MoveQueue:
+    # 后台 I/O 线程按批执行文件移动：先写意图并落盘，再移动，最后写完成记录
+    # 界面线程只负责入队，不等待磁盘
+    def __init__(self, work_dir, batch_size=64, journal_name=JOURNAL_NAME):
+        self.work_dir = work_dir
+        self.journal_path = os.path.join(work_dir, journal_name)
+        self.batch_size = batch_size
+        self.cond = threading.Condition()
+        self.pending = []
+        self.in_flight = []
+        self.failures = []
+        self.next_id = 1
+        self.closed = False
+        self.moved = 0
+        self.thread = None
+
+    def _paths(self, op):
+        src = os.path.join(self.work_dir, op['name'])
+        dst = os.path.join(self.work_dir, op['category'], op['name'])
+        return (dst, src) if op['op'] == 'undo' else (src, dst)
+
+    def _part(self, dst):
+        return os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}{PART_EXT}")
+
+    def _move(self, src, dst):
+        # 先移到目标目录下的临时名再改名，跨盘复制到一半时崩溃只会留下临时文件；目标已存在时不覆盖
+        if os.path.exists(dst):
+            raise FileExistsError(errno.EEXIST, "目标已存在同名文件", dst)
+        part = self._part(dst)
+        shutil.move(src, part)
+        os.replace(part, dst)
+
+    def _append(self, records):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def recover(self):
+        # 启动时回放日志：补完中断的操作，返回仍然有效的移动记录 [(name, index, category, op_id)]
+        # 无法补完的操作（如目标已有同名文件）放进 failures，由界面提示
+        ops = {}
+        done = set()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时可能留下半行，直接忽略
+                        continue
+                    if record['op'] in ('move', 'undo'):
+                        ops[record['id']] = record
+                    elif record['op'] == 'done':
+                        done.add(record['id'])
+                    elif record['op'] == 'fail':
+                        ops.pop(record['id'], None)
+        for op_id, op in ops.items():
+            if op_id in done:
+                continue
+            src, dst = self._paths(op)
+            part = self._part(dst)
+            if os.path.exists(src):
+                # 源文件还在说明移动没有完成：临时文件是上次复制了一半的，删掉后重新执行
+                if os.path.exists(part):
+                    os.remove(part)
+                try:
+                    self._move(src, dst)
+                except OSError as e:
+                    self.failures.append((op, str(e)))
+                    continue
+                done.add(op_id)
+            elif os.path.exists(part) and not os.path.exists(dst):
+                # 已复制完并删除源文件，只差改名
+                os.replace(part, dst)
+                done.add(op_id)
+            elif os.path.exists(dst):
+                done.add(op_id)
+        history = {}
+        for op_id in sorted(ops):
+            op = ops[op_id]
+            if op_id not in done:
+                continue
+            if op['op'] == 'move':
+                history[op_id] = op
+            else:
+                history.pop(op.get('ref'), None)
+        # 压缩日志，只保留有效的移动记录
+        records = []
+        for op_id, op in history.items():
+            records += [op, {'op': 'done', 'id': op_id}]
+        tmp = self.journal_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+        self.next_id = max(ops, default=0) + 1
+        return [(op['name'], op['index'], op['category'], op_id) for op_id, op in history.items()]
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='move-queue', daemon=True)
+        self.thread.start()
+
+    def move(self, name, category, index):
+        return self._submit({'op': 'move', 'name': name, 'category': category, 'index': index})
+
+    def undo(self, op_id, name, category):
+        # 还在排队的移动直接取消；已执行或正在执行的则追加一次反向移动
+        with self.cond:
+            for op in self.pending:
+                if op['id'] == op_id:
+                    self.pending.remove(op)
+                    self.cond.notify_all()
+                    return None
+        return self._submit({'op': 'undo', 'ref': op_id, 'name': name, 'category': category})
+
+    def _submit(self, op):
+        with self.cond:
+            op['id'] = self.next_id
+            self.next_id += 1
+            self.pending.append(op)
+            self.cond.notify_all()
+        return op['id']
+
+    def busy(self, name):
+        with self.cond:
+            return any(op['name'] == name for op in self.pending + self.in_flight)
+
+    def wait(self, name, timeout=None):
+        # 等待与该文件相关的操作全部完成（供后台线程在读取文件前调用）
+        with self.cond:
+            return self.cond.wait_for(lambda: not any(op['name'] == name for op in self.pending + self.in_flight), timeout)
+
+    def flush(self, timeout=None):
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+
+    def pop_failures(self):
+        with self.cond:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.closed)
+                if not self.pending:
+                    return
+                batch = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                self.in_flight = batch
+            results = []
+            failed = []
+            try:
+                self._append(batch)
+            except OSError as e:
+                # 日志写不进去就不动文件，整批按失败处理
+                failed = [(op, str(e)) for op in batch]
+                batch = []
+            for op in batch:
+                src, dst = self._paths(op)
+                try:
+                    self._move(src, dst)
+                    results.append({'op': 'done', 'id': op['id']})
+                except OSError as e:
+                    results.append({'op': 'fail', 'id': op['id'], 'error': str(e)})
+                    failed.append((op, str(e)))
+            try:
+                if results:
+                    self._append(results)
+            except OSError:
+                # 完成记录丢失时，下次启动会根据文件实际位置重新核对
+                pass
+            with self.cond:
+                self.in_flight = []
+                self.moved += len(results) - sum(1 for r in results if r['op'] == 'fail')
+                self.failures += failed
+                self.cond.notify_all()
@@ -0,0 +1,177 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from composite import MASK_THRESHOLD, OVERLAY_ALPHA, OVERLAY_COLOR, assemble_layout, split_parts
+from disk_cache import CACHE_DIR_NAME, LAYOUTS, DiskCache, cache_salt
+from work_queue import get_image_files
+
+# 每个工作进程各自持有一份配置和磁盘缓存对象
+_worker = {}
+# 本批写入缓存的总量达到上限的这一比例后停止写入，与淘汰后保留的 90% 一致，保证队列前面的图片不被淘汰
+CACHE_FILL = 0.9
+
+
+def _init_worker(options):
+    _worker.update(options)
+    if options['cache_dir']:
+        # 工作进程只写入不淘汰，写入量由主进程控制，全部完成后再统一按上限清理
+        _worker['cache'] = DiskCache(options['cache_dir'], float('inf'), options['max_side'], options['salt'])
+
+
+def _process(path, use_cache=True):
+    # 返回 (文件名, 状态, 错误, 缓存文件大小)；use_cache 为 False 时只导出，不写缓存
+    name = os.path.basename(path)
+    size = 0
+    try:
+        cache = _worker.get('cache') if use_cache else None
+        if cache is not None and not _worker['force']:
+            # 已有缓存也更新使用时间，整批清理时与新写入的一起保留
+            size = cache.touch(path)
+            if size is not None:
+                return name, 'skipped', None, size
+        parts = split_parts(path, _worker['threshold'], _worker['alpha'], _worker['color'])
+        if cache is not None:
+            size = cache.put(path, parts)
+        if _worker['output']:
+            for layout_mode in _worker['layouts']:
+                out_dir = os.path.join(_worker['output'], layout_mode)
+                os.makedirs(out_dir, exist_ok=True)
+                assemble_layout(parts, layout_mode).save(os.path.join(out_dir, os.path.splitext(name)[0] + '.png'))
+    except Exception as e:
+        return name, 'failed', str(e), size or 0
+    return name, 'done', None, size
+
+
+def preprocess_dir(work_dir, cache_dir=None, output=None, layouts=LAYOUTS, workers=None, force=False,
+                   threshold=MASK_THRESHOLD, alpha=OVERLAY_ALPHA, color=OVERLAY_COLOR,
+                   max_bytes=None, max_side=2048, progress=None, warn=None):
+    # 用进程池并行预处理整个目录，结果写入磁盘缓存和/或输出目录，返回统计信息
+    # 缓存放不下整批时只缓存队列前面的图片，warn 收到提示信息，统计中 uncached 为未写入缓存的张数
+    paths = [os.path.join(work_dir, name) for name in get_image_files(work_dir)]
+    options = {
+        'cache_dir': cache_dir,
+        'output': output,
+        'layouts': tuple(layouts),
+        'force': force,
+        'threshold': threshold,
+        'alpha': alpha,
+        'color': tuple(color),
+        'max_side': max_side,
+        'salt': cache_salt(threshold, alpha, color),
+    }
+    counts = {'done': 0, 'skipped': 0, 'failed': 0, 'uncached': 0}
+    failures = []
+    workers = workers or os.cpu_count()
+    # 按队列顺序提交，同时在途的任务有限，写入量接近上限时后面的图片不再写缓存
+    limit = max_bytes * CACHE_FILL if cache_dir and max_bytes else float('inf')
+    written = 0
+    cached = 0
+    full = False
+    warned = False
+    todo = deque(paths)
+    running = {}
+    finished = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        while todo or running:
+            while todo and len(running) < workers * 4:
+                if cache_dir and not full and not finished and running:
+                    # 还不知道单张缓存有多大，先等第一张完成
+                    break
+                if cache_dir and not full:
+                    # 在途的任务按已写入的平均大小估算
+                    average = written / cached if cached else 0
+                    full = written + average * sum(running.values()) >= limit
+                use_cache = bool(cache_dir) and not full
+                if cache_dir and not use_cache:
+                    if not output:
+                        # 既不写缓存也不导出，没有必要再处理
+                        todo.popleft()
+                        finished += 1
+                        if progress:
+                            progress(finished, len(paths), time.perf_counter() - start)
+                        continue
+                running[pool.submit(_process, todo.popleft(), use_cache)] = use_cache
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                name, status, err, size = future.result()
+                counts[status] += 1
+                if size:
+                    written += size
+                    cached += 1
+                if err:
+                    failures.append((name, err))
+                finished += 1
+                if progress:
+                    progress(finished, len(paths), time.perf_counter() - start)
+            if warn and not warned and cached and (full or cached >= min(len(paths), workers * 4)):
+                need = written / cached * len(paths)
+                if need > limit:
+                    warned = True
+                    fit = int(limit * cached / written)
+                    warn(f"本批 {len(paths)} 张预计需要 {need / 1024 ** 2:.0f}MB 缓存，超过上限 {max_bytes / 1024 ** 2:.0f}MB，"
+                         f"只有前约 {fit} 张会写入缓存")
+    elapsed = time.perf_counter() - start
+    if cache_dir:
+        cache = DiskCache(cache_dir, max_bytes or float('inf'), max_side, options['salt'])
+        if max_bytes:
+            cache.trim()
+        # 清理之后再数一遍，第一张就超过上限等情况也如实统计
+        failed = {name for name, _ in failures}
+        counts['uncached'] = sum(1 for path in paths if os.path.basename(path) not in failed and not cache.contains(path))
+    return {
+        'total': len(paths),
+        'done': counts['done'],
+        'skipped': counts['skipped'],
+        'uncached': counts['uncached'],
+        'failures': failures,
+        'seconds': elapsed,
+        'per_second': counts['done'] / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量预处理拼接大图，生成磁盘缓存或拼好的展示图")
+    parser.add_argument('work_dir', help="图片工作目录")
+    parser.add_argument('--cache-dir', help=f"磁盘缓存目录，默认 工作目录/{CACHE_DIR_NAME}")
+    parser.add_argument('--no-cache', action='store_true', help="不写磁盘缓存")
+    parser.add_argument('--output', help="同时把拼好的展示图保存为 PNG 到该目录")
+    parser.add_argument('--layout', choices=LAYOUTS + ('both',), default='both', help="--output 导出的排版")
+    parser.add_argument('--workers', type=int, help="进程数，默认使用全部 CPU")
+    parser.add_argument('--force', action='store_true', help="已有缓存也重新生成")
+    parser.add_argument('--threshold', type=int, default=MASK_THRESHOLD, help="掩码阈值")
+    parser.add_argument('--alpha', type=int, default=OVERLAY_ALPHA, help="叠加透明度")
+    parser.add_argument('--color', default=','.join(map(str, OVERLAY_COLOR)), help="叠加颜色，如 255,0,0")
+    parser.add_argument('--max-gb', type=float, default=8.0, help="磁盘缓存上限（GB），单张约 0.2~0.4MB")
+    args = parser.parse_args(argv)
+    cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(args.work_dir, CACHE_DIR_NAME))
+    if cache_dir is None and not args.output:
+        parser.error("--no-cache 时必须指定 --output")
+    layouts = LAYOUTS if args.layout == 'both' else (args.layout,)
+    color = tuple(int(c) for c in args.color.split(','))
+
+    def progress(i, total, elapsed):
+        if i % 100 == 0 or i == total:
+            print(f"\r{i}/{total}  {i / elapsed:.1f} 张/秒", end='', flush=True)
+
+    stats = preprocess_dir(args.work_dir, cache_dir, args.output, layouts, args.workers, args.force,
+                           args.threshold, args.alpha, color, int(args.max_gb * 1024 ** 3), progress=progress,
+                           warn=lambda message: print(f"\n警告：{message}"))
+    print()
+    print(f"共 {stats['total']} 张，完成 {stats['done']}，跳过 {stats['skipped']}，失败 {len(stats['failures'])}，"
+          f"耗时 {stats['seconds']:.2f}s（{stats['per_second']:.1f} 张/秒）")
+    if stats['uncached']:
+        print(f"缓存已满，{stats['uncached']} 张未写入缓存，可用 --max-gb 调大上限")
+    for name, err in stats['failures']:
+        print(f"  失败 {name}: {err}")
+    return 1 if stats['failures'] else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
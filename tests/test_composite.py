@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from composite import assemble_layout, split_array
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'img_min_text')
+
+
+def pil_reference(big_img, layout_mode):
+    # 改成 NumPy 之前的 PIL 实现，作为逐像素对照的基准
+    w, h = big_img.size
+    part_w = w // 3
+    orig_img = big_img.crop((0, 0, part_w, h))
+    mask_img = big_img.crop((part_w, 0, part_w * 2, h)).convert('L')
+    crop_img = big_img.crop((part_w * 2, 0, w, h))
+    red = Image.new('RGB', orig_img.size, (255, 0, 0))
+    label_img = Image.composite(red, orig_img.copy(), mask_img.point(lambda x: 128 if x > 30 else 0))
+    imgs = [orig_img, mask_img.convert('RGB'), label_img, crop_img]
+    if layout_mode == 'grid':
+        col1_w = max(orig_img.width, label_img.width)
+        row1_h = max(orig_img.height, mask_img.height)
+        out = Image.new('RGB', (col1_w + max(mask_img.width, crop_img.width), row1_h + max(label_img.height, crop_img.height)))
+        out.paste(imgs[0], (0, 0))
+        out.paste(imgs[1], (col1_w, 0))
+        out.paste(imgs[2], (0, row1_h))
+        out.paste(imgs[3], (col1_w, row1_h))
+        return out
+    out = Image.new('RGB', (sum(im.width for im in imgs), max(im.height for im in imgs)))
+    x = 0
+    for im in imgs:
+        out.paste(im, (x, 0))
+        x += im.width
+    return out
+
+
+def random_triptych(width, height, seed):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def sample_images():
+    names = sorted(os.listdir(SAMPLES)) if os.path.isdir(SAMPLES) else []
+    return [Image.open(os.path.join(SAMPLES, name)).convert('RGB') for name in names]
+
+
+@pytest.mark.parametrize('layout_mode', ['grid', 'row'])
+def test_matches_pil_reference(layout_mode):
+    # 示例图片，加上宽度不能被 3 整除的随机图片（修剪图比另外两块宽）
+    images = sample_images() + [random_triptych(w, h, w) for w, h in ((301, 17), (302, 40), (90, 31))]
+    for big_img in images:
+        parts = split_array(np.asarray(big_img))
+        expected = np.asarray(pil_reference(big_img, layout_mode))
+        assert np.array_equal(np.asarray(assemble_layout(parts, layout_mode)), expected)
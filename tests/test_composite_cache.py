@@ -0,0 +1,76 @@
+import numpy as np
+from PIL import Image
+
+from composite_cache import CompositeCache, parts_bytes
+
+
+def level(side=10):
+    # 每层 side*side*3 字节
+    return [Image.new('RGB', (side, side))]
+
+
+def assemble(parts, layout_mode):
+    return level()
+
+
+def test_evicts_least_recently_used_outside_focus():
+    cache = CompositeCache(900, assemble)
+    for name in 'abc':
+        cache.put(name, None, {'grid': level()})
+    cache.set_focus(['a'])
+    cache.get('b', 'grid')
+    cache.put('d', None, {'grid': level()})
+    # a 在窗口内，c 是窗口外最久未用的
+    assert list(cache.entries) == ['a', 'b', 'd']
+    assert cache.total_bytes == 900
+    assert cache.evictions == 1
+
+
+def test_put_never_evicts_the_entry_being_stored():
+    # 窗口内的条目已占满预算，再放入窗口外、带两种排版的条目
+    cache = CompositeCache(900, assemble)
+    for name in 'abc':
+        cache.put(name, None, {'grid': level()})
+    cache.set_focus(['a', 'b', 'c'])
+    cache.put('d', None, {'grid': level(), 'row': level()})
+    assert 'd' in cache
+    assert cache.get('d', 'row') is not None
+    assert cache.total_bytes <= 900
+
+
+def test_get_reassembly_never_evicts_the_entry_being_read():
+    parts = [np.zeros((10, 10, 3), dtype=np.uint8)]
+    cache = CompositeCache(900, assemble)
+    for name in 'abc':
+        cache.put(name, None, {'grid': level()})
+    cache.set_focus(['a', 'b', 'c'])
+    cache.put('d', parts)
+    assert cache.get('d', 'grid') is not None
+    assert 'd' in cache
+    assert cache.total_bytes <= 900
+
+
+def test_single_entry_over_budget_is_kept():
+    cache = CompositeCache(100, assemble)
+    cache.put('a', None, {'grid': level()})
+    cache.put('b', None, {'grid': level()})
+    assert list(cache.entries) == ['b']
+
+
+def test_failed_marker_and_missing_layout():
+    cache = CompositeCache(10000, assemble)
+    cache.put('bad', None)
+    assert cache.is_failed('bad')
+    assert cache.get('bad', 'grid') is None
+    # 没有分图、也没有该排版的条目按未命中处理并丢弃
+    cache.put('a', None, {'grid': level()})
+    assert not cache.is_failed('a')
+    assert cache.get('a', 'row') is None
+    assert 'a' not in cache
+
+
+def test_parts_bytes_counts_shared_buffer_once():
+    big = np.zeros((10, 30, 3), dtype=np.uint8)
+    views = [big[:, :10], big[:, 10:20], big[:, 20:]]
+    assert parts_bytes(views) == big.nbytes
+    assert parts_bytes(None) == 0
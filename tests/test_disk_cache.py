@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from composite import Parts, compose_levels, split_array
+from disk_cache import DiskCache
+
+
+def sample(tmp_path, size=(1536, 512), name='a.png'):
+    rng = np.random.default_rng(0)
+    big = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    part_w = size[0] // 3
+    big[:, :part_w] = 120
+    big[size[1] // 4:size[1] // 2, part_w:part_w * 2] = 255
+    big[:, part_w * 2:] = rng.integers(0, 40, (size[1], size[0] - part_w * 2, 3))
+    path = os.path.join(str(tmp_path), name)
+    Image.fromarray(big).save(path)
+    return path, split_array(big)
+
+
+def test_roundtrip_matches_layouts(tmp_path):
+    path, parts = sample(tmp_path)
+    cache = DiskCache(os.path.join(str(tmp_path), 'cache'), float('inf'))
+    assert cache.get(path) is None
+    cache.put(path, parts)
+    cached, layouts = cache.get(path)
+    assert set(layouts) == {'grid', 'row'}
+    for layout_mode, levels in layouts.items():
+        expected = compose_levels(parts, layout_mode)
+        assert [level.size for level in levels] == [level.size for level in expected]
+        assert not levels.reduced
+        diff = np.abs(np.asarray(levels[0], dtype=int) - np.asarray(expected[0], dtype=int))
+        assert diff.mean() < 2
+    assert cached[1].ndim == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_only_requested_layout_is_composed(tmp_path):
+    path, parts = sample(tmp_path)
+    cache = DiskCache(os.path.join(str(tmp_path), 'cache'), float('inf'))
+    cache.put(path, parts)
+    _, layouts = cache.get(path, ('grid',))
+    assert list(layouts) == ['grid']
+
+
+def test_large_image_is_stored_at_display_size(tmp_path):
+    path, parts = sample(tmp_path, (4500, 1500))
+    cache = DiskCache(os.path.join(str(tmp_path), 'cache'), float('inf'), max_side=2048)
+    cache.put(path, parts)
+    assert os.path.getsize(cache._file(cache.key(path))) < 1024 * 1024
+    _, layouts = cache.get(path)
+    for layout_mode, levels in layouts.items():
+        assert max(levels[0].size) <= 2048
+        assert levels.reduced
+        assert levels.full_size == compose_levels(parts, layout_mode).full_size
+
+
+def test_reduced_decode_keeps_full_size(tmp_path):
+    path, parts = sample(tmp_path)
+    parts = Parts(parts, (3072, 1024))
+    cache = DiskCache(os.path.join(str(tmp_path), 'cache'), float('inf'))
+    cache.put(path, parts)
+    _, layouts = cache.get(path, ('row',))
+    assert layouts['row'].full_size == (4096, 1024)
+    assert layouts['row'].reduced
+
+
+def test_changed_file_misses(tmp_path):
+    path, parts = sample(tmp_path)
+    cache = DiskCache(os.path.join(str(tmp_path), 'cache'), float('inf'))
+    cache.put(path, parts)
+    with open(path, 'ab') as f:
+        f.write(b'x')
+    assert cache.get(path) is None
+
+
+def test_trim_evicts_least_recently_used(tmp_path):
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    cache = DiskCache(cache_dir, float('inf'))
+    paths = []
+    for i in range(3):
+        path, parts = sample(tmp_path, name=f'{i}.png')
+        cache.put(path, parts)
+        file = cache._file(cache.key(path))
+        os.utime(file, (1000 + i, 1000 + i))
+        paths.append(path)
+    size = os.path.getsize(cache._file(cache.key(paths[0])))
+    small = DiskCache(cache_dir, size * 2.5)
+    small.trim()
+    assert small.get(paths[0]) is None
+    assert small.get(paths[2]) is not None
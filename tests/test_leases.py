@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+import pytest
+
+from leases import ALIVE_EXT, CLAIMED, DONE, GONE, LEASED, LeaseManager
+
+
+def manager(work_dir, tag, ttl=60):
+    leases = LeaseManager(work_dir, ttl)
+    # 同一个测试进程里模拟不同实例
+    leases.owner += f'-{tag}'
+    return leases
+
+
+def expire(path):
+    old = time.time() - 3600
+    os.utime(path, (old, old))
+
+
+@pytest.fixture
+def work_dir(tmp_path):
+    for name in ('a.png', 'b.png'):
+        (tmp_path / name).write_bytes(b'image')
+    return str(tmp_path)
+
+
+def test_claim_is_exclusive(work_dir):
+    a, b = manager(work_dir, 'A'), manager(work_dir, 'B')
+    assert a.claim('a.png') == CLAIMED
+    assert b.claim('a.png') == LEASED
+    assert b.state('a.png') == LEASED
+    assert a.claim('a.png') == CLAIMED
+    assert b.claim('missing.png') == GONE
+
+
+def test_finish_and_reopen(work_dir):
+    a, b = manager(work_dir, 'A'), manager(work_dir, 'B')
+    a.claim('a.png')
+    a.finish('a.png')
+    assert b.claim('a.png') == DONE
+    assert a.state('a.png') == DONE
+    a.reopen('a.png')
+    assert a.claim('a.png') == CLAIMED
+    assert b.claim('a.png') == LEASED
+
+
+def test_expired_lease_is_taken_over_and_old_owner_lets_go(work_dir):
+    a, b = manager(work_dir, 'A'), manager(work_dir, 'B')
+    assert b.claim('b.png') == CLAIMED
+    path = b._path('b.png')
+    expire(path)
+    assert a.claim('b.png') == CLAIMED
+    # B 还以为自己持有，核对租约文件后发现已被接管
+    assert b.claim('b.png') == LEASED
+    assert 'b.png' not in b.owned
+    # B 的心跳、完成和释放都不能动 A 的租约
+    b.owned.add('b.png')
+    b._heartbeat()
+    assert 'b.png' not in b.owned
+    b.owned.add('b.png')
+    b.release('b.png')
+    assert os.path.exists(path)
+    assert a.claim('b.png') == CLAIMED
+
+
+def test_heartbeat_refreshes_own_leases(work_dir):
+    a = manager(work_dir, 'A')
+    a.claim('a.png')
+    path = a._path('a.png')
+    expire(path)
+    a._heartbeat()
+    assert time.time() - os.path.getmtime(path) < 60
+    assert 'a.png' in a.owned
+
+
+def test_own_lease_missing_from_owned_is_still_claimed(work_dir):
+    # 心跳因临时读取失败丢掉了记录，或者另一个线程刚领到：租约文件是自己的就仍算领到
+    a = manager(work_dir, 'A')
+    a.claim('a.png')
+    a.owned.discard('a.png')
+    assert a.claim('a.png') == CLAIMED
+    assert 'a.png' in a.owned
+
+
+def test_concurrent_claims_from_one_instance(work_dir):
+    a = manager(work_dir, 'A')
+    names = [f'{i}.png' for i in range(50)]
+    results = []
+    barrier = threading.Barrier(2)
+
+    def run():
+        barrier.wait()
+        results.append([a.claim(name, check_file=False) for name in names])
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(status == CLAIMED for statuses in results for status in statuses)
+
+
+def test_slots_are_distinct_and_reused_after_expiry(work_dir):
+    a, b = manager(work_dir, 'A'), manager(work_dir, 'B')
+    slot_a, slot_b = a.take_slot(), b.take_slot()
+    assert slot_a != slot_b
+    a._heartbeat()
+    assert a.progress()['annotators'] == 2
+    expire(a._path(slot_a, ALIVE_EXT))
+    c = manager(work_dir, 'C')
+    assert c.take_slot() == slot_a
+
+
+def test_take_slot_raises_when_lease_dir_is_not_writable(work_dir, monkeypatch):
+    a = manager(work_dir, 'A')
+    b = manager(work_dir, 'B')
+    b.take_slot()
+
+    def denied(path):
+        raise PermissionError(13, 'read-only', path)
+
+    monkeypatch.setattr(a, '_create', denied)
+    with pytest.raises(PermissionError):
+        a.take_slot()
+    # 领取图片时的写入错误按他人持有处理，不抛到界面
+    assert a.claim('a.png') == LEASED
+
+
+def test_close_releases_only_own_files(work_dir):
+    a, b = manager(work_dir, 'A'), manager(work_dir, 'B')
+    a.take_slot()
+    a.claim('a.png')
+    b.claim('b.png')
+    a.close()
+    assert sorted(os.listdir(a.lease_dir)) == ['b.png.lease']
@@ -0,0 +1,161 @@
+import json
+import os
+
+import pytest
+
+from move_queue import JOURNAL_NAME, PART_EXT, MoveQueue
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def write_journal(work_dir, records, tail=''):
+    with open(os.path.join(work_dir, JOURNAL_NAME), 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.write(tail)
+
+
+def read_journal(work_dir):
+    with open(os.path.join(work_dir, JOURNAL_NAME), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def move(op_id, name, category='清洗', index=0):
+    return {'op': 'move', 'id': op_id, 'name': name, 'category': category, 'index': index}
+
+
+def test_intent_only_is_completed(tmp_path):
+    # 只写了意图就崩溃：文件还在原处，回放时补做移动
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, 'a.png'), b'image')
+    os.makedirs(os.path.join(work_dir, '清洗'))
+    write_journal(work_dir, [move(1, 'a.png')])
+    mover = MoveQueue(work_dir)
+    assert mover.recover() == [('a.png', 0, '清洗', 1)]
+    assert not os.path.exists(os.path.join(work_dir, 'a.png'))
+    assert os.path.exists(os.path.join(work_dir, '清洗', 'a.png'))
+    assert read_journal(work_dir) == [move(1, 'a.png'), {'op': 'done', 'id': 1}]
+    assert mover.next_id == 2
+
+
+def test_moved_without_done_record(tmp_path):
+    # 已移动但完成记录没写进去：按文件实际位置确认完成
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, '保留', 'a.png'), b'image')
+    write_journal(work_dir, [move(1, 'a.png', '保留', 3)])
+    assert MoveQueue(work_dir).recover() == [('a.png', 3, '保留', 1)]
+    assert os.path.exists(os.path.join(work_dir, '保留', 'a.png'))
+
+
+def test_partial_copy_is_redone(tmp_path):
+    # 跨盘移动只复制了一半：删除临时文件后重新移动
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, 'a.png'), b'complete image')
+    write(os.path.join(work_dir, '清洗', '.a.png' + PART_EXT), b'comp')
+    write_journal(work_dir, [move(1, 'a.png')])
+    mover = MoveQueue(work_dir)
+    assert mover.recover() == [('a.png', 0, '清洗', 1)]
+    assert os.listdir(os.path.join(work_dir, '清洗')) == ['a.png']
+    with open(os.path.join(work_dir, '清洗', 'a.png'), 'rb') as f:
+        assert f.read() == b'complete image'
+    assert mover.pop_failures() == []
+
+
+def test_copied_but_not_renamed_is_finished(tmp_path):
+    # 复制完并删除了源文件，崩溃在改名之前
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, '清洗', '.a.png' + PART_EXT), b'complete image')
+    write_journal(work_dir, [move(1, 'a.png')])
+    assert MoveQueue(work_dir).recover() == [('a.png', 0, '清洗', 1)]
+    assert os.listdir(os.path.join(work_dir, '清洗')) == ['a.png']
+
+
+@pytest.mark.parametrize('existing', [b'old', b'an older, larger image'])
+def test_existing_target_is_never_deleted(tmp_path, existing):
+    # 分类文件夹里本来就有同名文件：不论大小都保留，两个文件都不动，作为失败报告
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, 'a.png'), b'new image')
+    write(os.path.join(work_dir, '清洗', 'a.png'), existing)
+    write_journal(work_dir, [move(1, 'a.png')])
+    mover = MoveQueue(work_dir)
+    assert mover.recover() == []
+    assert os.path.exists(os.path.join(work_dir, 'a.png'))
+    with open(os.path.join(work_dir, '清洗', 'a.png'), 'rb') as f:
+        assert f.read() == existing
+    failures = mover.pop_failures()
+    assert [op['id'] for op, _ in failures] == [1]
+    assert read_journal(work_dir) == []
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, '清洗', 'a.png'), b'image')
+    write(os.path.join(work_dir, 'b.png'), b'image')
+    write_journal(work_dir, [move(1, 'a.png'), {'op': 'done', 'id': 1}], tail='{"op": "move", "id": 2, "na')
+    mover = MoveQueue(work_dir)
+    assert mover.recover() == [('a.png', 0, '清洗', 1)]
+    # 半行对应的移动从未开始，文件留在原处
+    assert os.path.exists(os.path.join(work_dir, 'b.png'))
+    assert mover.next_id == 2
+
+
+def test_undo_cancels_move(tmp_path):
+    # 已完成的撤销抵消对应的移动；撤销意图已写但未执行时补做撤销
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, 'a.png'), b'image')
+    write(os.path.join(work_dir, '清洗', 'b.png'), b'image')
+    write_journal(work_dir, [
+        move(1, 'a.png'), {'op': 'done', 'id': 1},
+        {'op': 'undo', 'id': 2, 'ref': 1, 'name': 'a.png', 'category': '清洗'}, {'op': 'done', 'id': 2},
+        move(3, 'b.png'), {'op': 'done', 'id': 3},
+        {'op': 'undo', 'id': 4, 'ref': 3, 'name': 'b.png', 'category': '清洗'},
+    ])
+    assert MoveQueue(work_dir).recover() == []
+    assert os.path.exists(os.path.join(work_dir, 'a.png'))
+    assert os.path.exists(os.path.join(work_dir, 'b.png'))
+    assert read_journal(work_dir) == []
+
+
+def test_failed_move_is_dropped(tmp_path):
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, 'a.png'), b'image')
+    write_journal(work_dir, [move(1, 'a.png'), {'op': 'fail', 'id': 1, 'error': 'busy'}])
+    assert MoveQueue(work_dir).recover() == []
+    assert os.path.exists(os.path.join(work_dir, 'a.png'))
+
+
+def test_background_moves_and_undo(tmp_path):
+    work_dir = str(tmp_path)
+    for name in ('a.png', 'b.png'):
+        write(os.path.join(work_dir, name), b'image')
+    os.makedirs(os.path.join(work_dir, '清洗'))
+    mover = MoveQueue(work_dir)
+    mover.recover()
+    mover.start()
+    first = mover.move('a.png', '清洗', 0)
+    mover.move('b.png', '清洗', 1)
+    assert mover.flush(10)
+    mover.undo(first, 'a.png', '清洗')
+    mover.close(10)
+    assert os.path.exists(os.path.join(work_dir, 'a.png'))
+    assert os.path.exists(os.path.join(work_dir, '清洗', 'b.png'))
+    assert MoveQueue(work_dir).recover() == [('b.png', 1, '清洗', 2)]
+
+
+def test_background_move_does_not_overwrite(tmp_path):
+    work_dir = str(tmp_path)
+    write(os.path.join(work_dir, 'a.png'), b'new image')
+    write(os.path.join(work_dir, '清洗', 'a.png'), b'old image')
+    mover = MoveQueue(work_dir)
+    mover.recover()
+    mover.start()
+    mover.move('a.png', '清洗', 0)
+    mover.close(10)
+    assert [op['name'] for op, _ in mover.pop_failures()] == ['a.png']
+    with open(os.path.join(work_dir, '清洗', 'a.png'), 'rb') as f:
+        assert f.read() == b'old image'
+    assert os.path.exists(os.path.join(work_dir, 'a.png'))
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+from composite import MASK_THRESHOLD, OVERLAY_ALPHA, OVERLAY_COLOR, split_parts
+from disk_cache import DiskCache, cache_salt
+from preprocess import preprocess_dir
+from work_queue import get_image_files
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'img_min_text')
+
+
+def copy_samples(tmp_path, count):
+    work_dir = os.path.join(str(tmp_path), 'work')
+    os.makedirs(work_dir)
+    names = sorted(os.listdir(SAMPLES))[:count]
+    for i, name in enumerate(names):
+        shutil.copy(os.path.join(SAMPLES, name), os.path.join(work_dir, f'{i:03d}.png'))
+    return work_dir, [f'{i:03d}.png' for i in range(len(names))]
+
+
+def test_cache_and_skip(tmp_path):
+    work_dir, names = copy_samples(tmp_path, 4)
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    stats = preprocess_dir(work_dir, cache_dir, workers=2, max_bytes=10 ** 9)
+    assert (stats['done'], stats['skipped'], stats['uncached'], stats['failures']) == (4, 0, 0, [])
+    stats = preprocess_dir(work_dir, cache_dir, workers=2, max_bytes=10 ** 9)
+    assert (stats['done'], stats['skipped']) == (0, 4)
+
+
+def test_cap_keeps_start_of_queue(tmp_path):
+    # 上限只够几张：队列前面的写入缓存并保留，后面的不写入，并给出提示
+    work_dir, names = copy_samples(tmp_path, 12)
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    probe = DiskCache(os.path.join(str(tmp_path), 'probe'), float('inf'))
+    size = max(probe.put(os.path.join(work_dir, name), split_parts(os.path.join(work_dir, name))) for name in names)
+    names = get_image_files(work_dir)
+    messages = []
+    stats = preprocess_dir(work_dir, cache_dir, workers=1, max_bytes=size * 5, warn=messages.append)
+    cache = DiskCache(cache_dir, float('inf'), salt=cache_salt(MASK_THRESHOLD, OVERLAY_ALPHA, OVERLAY_COLOR))
+    cached = [cache.contains(os.path.join(work_dir, name)) for name in names]
+    assert cached == sorted(cached, reverse=True)
+    assert 1 <= sum(cached) < len(names)
+    assert stats['uncached'] == len(names) - sum(cached)
+    assert stats['done'] == sum(cached)
+    assert len(messages) == 1
+
+
+def test_output_continues_without_cache(tmp_path):
+    work_dir, names = copy_samples(tmp_path, 6)
+    cache_dir = os.path.join(str(tmp_path), 'cache')
+    output = os.path.join(str(tmp_path), 'out')
+    stats = preprocess_dir(work_dir, cache_dir, output, layouts=('row',), workers=1, max_bytes=1)
+    assert stats['uncached'] == len(names)
+    assert sorted(os.listdir(os.path.join(output, 'row'))) == names
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from work_queue import WorkQueue
+
+
+def check(queue, model):
+    assert len(queue) == len(model)
+    assert list(queue) == model
+    for pos, name in enumerate(model):
+        assert queue[pos] == name
+        assert queue.index(name) == pos
+        assert name in queue
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_list_model(seed):
+    # 随机执行追加、按位置删除、按名字移除、恢复，与按发现顺序排列的普通列表逐步对照
+    rng = random.Random(seed)
+    queue = WorkQueue()
+    order = []
+    removed = set()
+    counter = 0
+    for _ in range(400):
+        action = rng.random()
+        if action < 0.35 or not order:
+            name = f'img_{counter:05d}.png'
+            counter += 1
+            order.append(name)
+            queue.append(name)
+        elif action < 0.6 and len(queue):
+            pos = rng.randrange(len(queue))
+            removed.add(queue[pos])
+            del queue[pos]
+        elif action < 0.8 and len(queue):
+            name = rng.choice(list(queue))
+            removed.add(name)
+            queue.remove(name)
+        elif removed:
+            name = rng.choice(sorted(removed))
+            removed.discard(name)
+            model = [n for n in order if n not in removed]
+            assert queue.restore(name) == model.index(name)
+        check(queue, [n for n in order if n not in removed])
+
+
+def test_negative_and_out_of_range_positions():
+    queue = WorkQueue(['a', 'b', 'c'])
+    assert queue[-1] == 'c'
+    del queue[1]
+    assert queue[-1] == 'c'
+    with pytest.raises(IndexError):
+        queue[2]
+    with pytest.raises(ValueError):
+        queue.index('b')
+    with pytest.raises(ValueError):
+        queue.remove('b')
+
+
+def test_restore_unknown_name_appends():
+    # 上次会话移走的图片撤销回来时不在槽位表里，追加到末尾
+    queue = WorkQueue(['a', 'b'])
+    assert queue.restore('z') == 2
+    assert list(queue) == ['a', 'b', 'z']
+
+
+def test_append_existing_name_does_not_duplicate():
+    queue = WorkQueue(['a', 'b'])
+    queue.remove('a')
+    queue.append('a')
+    queue.append('b')
+    assert list(queue) == ['a', 'b']
+
+
+def test_find_wraps_around():
+    queue = WorkQueue(['cat_1', 'dog_1', 'cat_2', 'dog_2'])
+    assert queue.find('DOG', 2) == 3
+    assert queue.find('cat', 3) == 0
+    queue.remove('cat_1')
+    assert queue.find('cat') == 1
+    assert queue.find('bird') is None
+    assert queue.find('') is None
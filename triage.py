@@ -0,0 +1,242 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from composite import MASK_THRESHOLD, decode_scaled, to_gray
+from decisions import default_manifest_path
+from work_queue import get_image_files
+
+# 评分结果保存在工作目录下，下次打开时只重新计算新增或修改过的图片
+SCORES_NAME = '.piexl_triage.json'
+# 评分时按这个尺寸缩小解码，统计量都是比例，不需要原图分辨率
+TRIAGE_VIEW = (1024, 1024)
+# 修剪图灰度不超过该值视为黑色背景
+CROP_BLACK = 8
+# 自动预分的默认阈值：掩码几乎为空、几乎占满整张图、修剪图空白；max_components 为 None 表示不按连通块数判断
+DEFAULT_RULES = {
+    'min_coverage': 0.002,
+    'max_coverage': 0.95,
+    'min_crop_fill': 0.001,
+    'min_crop_std': 2.0,
+    'max_components': None,
+}
+
+
+def count_components(binary):
+    # 8 邻接连通块数：按行取出连续前景段，相邻两行重叠的段用并查集合并
+    h, w = binary.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = binary
+    diff = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(diff == 1)
+    ends = np.nonzero(diff == -1)[1] - 1
+    n = len(starts)
+    if not n:
+        return 0
+    row_start = np.searchsorted(rows, np.arange(h + 1)).tolist()
+    starts = starts.tolist()
+    ends = ends.tolist()
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    count = n
+    for r in range(1, h):
+        i, i_end = row_start[r - 1], row_start[r]
+        j, j_end = row_start[r], row_start[r + 1]
+        while i < i_end and j < j_end:
+            # 斜对角相邻也算连通，所以端点放宽一个像素
+            if starts[i] <= ends[j] + 1 and starts[j] <= ends[i] + 1:
+                a, b = find(i), find(j)
+                if a != b:
+                    parent[a] = b
+                    count -= 1
+            if ends[i] < ends[j]:
+                i += 1
+            else:
+                j += 1
+    return count
+
+
+def mask_stats(big, threshold=MASK_THRESHOLD):
+    # 三联图的统计量：掩码覆盖率、连通块数、修剪图非黑色比例及灰度标准差
+    part_w = big.shape[1] // 3
+    hit = to_gray(big[:, part_w:part_w * 2]) > threshold
+    crop = to_gray(big[:, part_w * 2:])
+    return {
+        'coverage': float(hit.mean()),
+        'components': count_components(hit),
+        'crop_fill': float((crop > CROP_BLACK).mean()),
+        'crop_std': float(crop.std()),
+    }
+
+
+def _low_score(value, limit):
+    # 不超过 limit 时为 1，达到 limit 的 100 倍时降到 0（按对数）
+    if value <= limit:
+        return 1.0
+    return max(0.0, 1 - math.log10(value / limit) / 2)
+
+
+def _high_score(value, limit):
+    # 从 limit 的一半线性升到 limit 时为 1
+    if value >= limit:
+        return 1.0
+    return max(0.0, (value - limit / 2) / (limit / 2))
+
+
+def evaluate(stats, rules=DEFAULT_RULES):
+    # 返回 (评分, 原因)：评分越接近 1 越可能是明显的坏图；原因不为空表示命中了硬阈值，可以自动预分
+    reasons = []
+    if stats['coverage'] <= rules['min_coverage']:
+        reasons.append('掩码为空')
+    if stats['coverage'] >= rules['max_coverage']:
+        reasons.append('掩码占满')
+    if stats['coverage'] > rules['min_coverage'] and (stats['crop_fill'] <= rules['min_crop_fill']
+                                                     or stats['crop_std'] <= rules['min_crop_std']):
+        reasons.append('修剪图空白')
+    if rules['max_components'] is not None and stats['components'] > rules['max_components']:
+        reasons.append('掩码破碎')
+    score = max(
+        _low_score(stats['coverage'], rules['min_coverage']),
+        _high_score(stats['coverage'], rules['max_coverage']),
+        _low_score(stats['crop_fill'], rules['min_crop_fill']),
+    )
+    if reasons:
+        score = 1.0
+    return score, ','.join(reasons)
+
+
+def file_key(path):
+    st = os.stat(path)
+    return f"{st.st_size}|{st.st_mtime_ns}"
+
+
+def process_pool(workers=None):
+    # 界面在后台线程里启动进程池，fork 一个多线程的进程可能让子进程卡在别的线程持有的锁上，所以用 spawn
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+
+
+def run_incremental(work_dir, names, saved, compute, args=(), workers=None, progress=None, stop=None):
+    # saved 为上次保存的 {文件名: 结果}，结果中的 key 与文件当前的大小和修改时间一致时直接复用
+    # 其余用进程池并行调用 compute(路径, *args)，它返回 (文件名, 结果, 错误)；新结果写回 saved
+    # stop 被设置时（如关闭窗口）放弃剩余任务；返回 ({文件名: 结果}, 失败列表, 新算出的个数)
+    items = {}
+    todo = []
+    for name in names:
+        path = os.path.join(work_dir, name)
+        old = saved.get(name)
+        try:
+            if old is not None and old.get('key') == file_key(path):
+                items[name] = old
+                continue
+        except OSError:
+            continue
+        todo.append(path)
+    failures = []
+    computed = 0
+    if todo:
+        pool = process_pool(workers)
+        try:
+            futures = [pool.submit(compute, path, *args) for path in todo]
+            for i, future in enumerate(as_completed(futures), 1):
+                name, item, err = future.result()
+                if err:
+                    failures.append((name, err))
+                else:
+                    items[name] = saved[name] = item
+                    computed += 1
+                if progress:
+                    progress(i, len(todo))
+                if stop is not None and stop.is_set():
+                    break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    return items, failures, computed
+
+
+def _score_one(path, threshold):
+    name = os.path.basename(path)
+    try:
+        big, _ = decode_scaled(path, TRIAGE_VIEW)
+        stats = mask_stats(big, threshold)
+        stats['key'] = file_key(path)
+    except Exception as e:
+        return name, None, str(e)
+    return name, stats, None
+
+
+def load_scores(scores_path, threshold=MASK_THRESHOLD):
+    # 阈值不同时统计量不同，旧结果作废
+    try:
+        with open(scores_path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('threshold') != threshold:
+        return {}
+    return data.get('items', {})
+
+
+def save_scores(scores_path, items, threshold=MASK_THRESHOLD):
+    os.makedirs(os.path.dirname(os.path.abspath(scores_path)), exist_ok=True)
+    tmp = scores_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'threshold': threshold, 'items': items}, f, ensure_ascii=False)
+    os.replace(tmp, scores_path)
+
+
+def score_dir(work_dir, names=None, scores_path=None, threshold=MASK_THRESHOLD, workers=None, progress=None, stop=None):
+    # 并行计算统计量，已保存且文件未变化的图片直接复用；返回 ({文件名: 统计量}, 失败列表)
+    scores_path = scores_path or default_manifest_path(work_dir, SCORES_NAME)
+    names = list(get_image_files(work_dir) if names is None else names)
+    saved = load_scores(scores_path, threshold)
+    items, failures, computed = run_incremental(work_dir, names, saved, _score_one, (threshold,), workers, progress, stop)
+    if computed:
+        # 已不在目录中的旧结果也保留，分类移走后撤销回来时不必重新计算
+        save_scores(scores_path, saved, threshold)
+    return items, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按掩码统计量给图片打分，找出明显有问题的图片")
+    parser.add_argument('work_dir', help="图片工作目录")
+    parser.add_argument('--workers', type=int, help="进程数，默认使用全部 CPU")
+    parser.add_argument('--threshold', type=int, default=MASK_THRESHOLD, help="掩码阈值")
+    for key, value in DEFAULT_RULES.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=float if key != 'max_components' else int, default=value)
+    parser.add_argument('--list', action='store_true', help="列出命中阈值的图片")
+    args = parser.parse_args(argv)
+    if not 0 <= args.min_coverage < args.max_coverage <= 1:
+        parser.error("需要 0 <= --min-coverage < --max-coverage <= 1")
+    rules = {key: getattr(args, key) for key in DEFAULT_RULES}
+    start = time.perf_counter()
+    items, failures = score_dir(args.work_dir, threshold=args.threshold, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    flagged = []
+    for name, stats in sorted(items.items()):
+        score, reason = evaluate(stats, rules)
+        if reason:
+            flagged.append((name, reason))
+    print(f"共 {len(items)} 张，命中阈值 {len(flagged)} 张，失败 {len(failures)}，耗时 {elapsed:.2f}s")
+    if args.list:
+        for name, reason in flagged:
+            print(f"  {name}: {reason}")
+    for name, err in failures:
+        print(f"  失败 {name}: {err}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
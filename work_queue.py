@@ -0,0 +1,135 @@
+import os
+
+image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
+
+
+# 流式扫描目录，边扫描边返回图片文件名
+def iter_image_files(work_dir):
+    with os.scandir(work_dir) as it:
+        for entry in it:
+            if os.path.splitext(entry.name)[1].lower() in image_extensions and entry.is_file():
+                yield entry.name
+
+
+# 获取当前目录所有图片
+def get_image_files(work_dir):
+    # 返回文件名列表
+    return list(iter_image_files(work_dir))
+
+
+class WorkQueue:
+    # 待分类图片队列：每个文件名按发现顺序占一个固定槽位，用树状数组记录槽位是否仍在队列中
+    # 按位置取值、查位置、移除、恢复都是 O(log n)，撤销时图片回到原来的相对位置
+    def __init__(self, names=()):
+        self.names = []
+        self.slot_of = {}
+        self.present = []
+        self.tree = [0]
+        self.count = 0
+        self.extend(names)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        slot = self.slot_of.get(name)
+        return slot is not None and self.present[slot]
+
+    def __iter__(self):
+        for slot, name in enumerate(self.names):
+            if self.present[slot]:
+                yield name
+
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += self.count
+        if not 0 <= pos < self.count:
+            raise IndexError(pos)
+        return self.names[self._find(pos + 1)]
+
+    def __delitem__(self, pos):
+        self.remove(self[pos])
+
+    def extend(self, names):
+        for name in names:
+            self.append(name)
+
+    def append(self, name):
+        if name in self.slot_of:
+            self.restore(name)
+            return
+        slot = len(self.names)
+        self.names.append(name)
+        self.slot_of[name] = slot
+        self.present.append(True)
+        # 新槽位 i 覆盖区间 (i - lowbit(i), i]，其和可由已有节点直接求出
+        i = slot + 1
+        total = 1
+        j = i - 1
+        low = i - (i & -i)
+        while j > low:
+            total += self.tree[j]
+            j -= j & -j
+        self.tree.append(total)
+        self.count += 1
+
+    def _update(self, slot, delta):
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def _find(self, k):
+        # 找到第 k 个仍在队列中的槽位（k 从 1 开始）
+        pos = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+    def index(self, name):
+        if name not in self:
+            raise ValueError(f"{name} 不在队列中")
+        return self._prefix(self.slot_of[name])
+
+    def remove(self, name):
+        if name not in self:
+            raise ValueError(f"{name} 不在队列中")
+        slot = self.slot_of[name]
+        self.present[slot] = False
+        self._update(slot, -1)
+        self.count -= 1
+
+    def restore(self, name):
+        # 放回原槽位；从未出现过的文件名（如上次会话移走的图片）追加到末尾
+        slot = self.slot_of.get(name)
+        if slot is None:
+            self.append(name)
+        elif not self.present[slot]:
+            self.present[slot] = True
+            self._update(slot, 1)
+            self.count += 1
+        return self.index(name)
+
+    def find(self, text, start=0):
+        # 从 start 位置往后查找第一个包含 text 的文件名（不区分大小写），找不到时从头再找
+        text = text.lower()
+        if not text or not self.count:
+            return None
+        start_slot = self.slot_of[self[start]] if 0 < start < self.count else 0
+        for slots in (range(start_slot, len(self.names)), range(0, start_slot)):
+            for slot in slots:
+                if self.present[slot] and text in self.names[slot].lower():
+                    return self._prefix(slot)
+        return None